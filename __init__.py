@@ -23,28 +23,40 @@ speaker on the equipment.)
 """
 import random
 import re
-import signal
 import time
 
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from os.path import abspath, dirname, join
-from subprocess import call, Popen, DEVNULL
+from threading import Event
+from subprocess import call, DEVNULL
 from socket import gethostname
 
 import spotipy
 
 from mycroft.skills.core import intent_handler
-from mycroft.util.parse import match_one, fuzzy_match
 from mycroft.api import DeviceApi
 from mycroft.messagebus import Message
 
 from adapt.intent import IntentBuilder
 from requests import HTTPError
 
+from .auth import AUTH_DIR, ensure_auth_dir_exists
+from .cache import PersistentCache
 from .exceptions import (NoSpotifyDevicesError,
                          PlaylistNotFoundError,
                          SpotifyNotAuthorizedError)
 
+from .devices import DeviceChoice, DeviceRegistry
+from .librespot import LibrespotSupervisor
+from .library import SavedAlbums, SavedTracks, UserPlaylists
+from .library_index import LIBRARY_KINDS, LibraryIndex, library_result
+from .matching import Candidates, best_confidence, fuzzy_match
+from .metrics import prometheus_stats, write_prometheus
+from .prefetch import DEFAULT_BUDGET, Prefetcher
+from .query_patterns import QUERY_KINDS, QueryPatterns
+from .ratelimit import BACKGROUND, request_lane
+from .tracing import TRACER
 from .spotify import (MycroftSpotifyCredentials, SpotifyConnect,
                       get_album_info, get_artist_info, get_song_info,
                       get_show_info, load_local_credentials)
@@ -58,6 +70,8 @@ class DeviceType(Enum):
     DESKTOP = 3
     FIRSTBEST = 4
     NOTFOUND = 5
+    PLAYING = 6
+    ACTIVE = 7
 
 
 # Platforms for which the skill should start the spotify player
@@ -71,6 +85,42 @@ DIRECT_RESPONSE_CONFIDENCE = 0.8
 
 MATCH_CONFIDENCE = 0.5
 
+# Number of worker threads used when searching concurrently
+MAX_SEARCH_WORKERS = 5
+
+# Types requested by the combined search of generic queries
+COMBINED_SEARCH_TYPES = ('artist', 'track', 'album', 'playlist')
+
+# Time in seconds between status polls when the playback state is unknown
+# or doesn't match the expected track progress
+MONITOR_POLL_INTERVAL = 5
+# Max time in seconds between status polls while playing as expected
+MONITOR_MAX_INTERVAL = 60
+# Time in seconds after the expected end of a track to poll the status
+MONITOR_TRACK_END_MARGIN = 1
+# Max difference in seconds between the reported and expected progress
+MONITOR_PROGRESS_TOLERANCE = 2
+
+# Time in seconds between prefetches of likely requests
+PREFETCH_INTERVAL = 15 * 60
+# Time in seconds without requests before prefetching
+PREFETCH_IDLE_TIME = 60
+
+# Time in seconds between compactions of the persistent cache
+CACHE_COMPACT_INTERVAL = 60 * 60
+
+# Max time in seconds to wait for librespot's device to be registered
+LIBRESPOT_START_TIMEOUT = 10
+# Time in seconds between checks for librespot's device
+LIBRESPOT_POLL_INTERVAL = 0.5
+
+# Max time in seconds to wait for the confirmation to be spoken before
+# starting playback, the fixed delay used before
+SPEECH_TIMEOUT = 2
+
+# Time in seconds between updates of the metrics file
+METRICS_INTERVAL = 60
+
 
 def best_result(results):
     """Return best result from a list of result tuples.
@@ -88,24 +138,24 @@ def best_result(results):
         return sorted(results, key=lambda x: x[0])[-1]
 
 
-def best_confidence(title, query):
-    """Find best match for a title against a query.
+def query_attributes(result):
+    """Span attributes of a query result."""
+    confidence, data = result
+    return {'confidence': confidence,
+            'type': data.get('type') if isinstance(data, dict) else None}
 
-    Some titles include ( Remastered 2016 ) and similar info. This method
-    will test the raw title and a version that has been parsed to remove
-    such information.
 
-    Arguments:
-        title: title name from spotify search
-        query: query from user
+def match_attributes(result):
+    """Span attributes of a CPS_match_query_phrase() result."""
+    if not result:
+        return {'level': None}
+    return {'level': result[1].name,
+            'type': result[2].get('type') if len(result) > 2 else None}
 
-    Returns:
-        (float) best condidence
-    """
-    best = title.lower()
-    best_stripped = re.sub(r'(\(.+\)|-.+)$', '', best).strip()
-    return max(fuzzy_match(best, query),
-               fuzzy_match(best_stripped, query))
+
+def device_attributes(choice):
+    """Span attributes of a DeviceChoice."""
+    return {'device_type': choice.device_type.name, 'remote': choice.remote}
 
 
 def update_librespot():
@@ -115,6 +165,31 @@ def update_librespot():
         print('Librespot Update failed, {}'.format(repr(e)))
 
 
+def int_setting(settings, name):
+    """Return an integer setting, None if not set or invalid."""
+    try:
+        return int(settings.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def track_position(status):
+    """Return the track uri, progress and duration from spotify status.
+
+    Arguments:
+        status (dict): Spotify status info
+
+    Returns:
+        tuple (uri, progress, duration) with times in seconds or None if
+        not available
+    """
+    try:
+        return (status['item']['uri'], status['progress_ms'] / 1000,
+                status['item']['duration_ms'] / 1000)
+    except (KeyError, TypeError):
+        return None
+
+
 def status_info(status):
     """Return track, artist, album tuple from spotify status.
 
@@ -146,42 +221,95 @@ class SpotifySkill(CommonPlaySkill):
         super(SpotifySkill, self).__init__()
         self.index = 0
         self.spotify = None
-        self.process = None
+        self.librespot = LibrespotSupervisor(
+            self.launch_librespot, on_crash=self.handle_librespot_crash)
         self.device_name = None
         self.dev_id = None
         self.idle_count = 0
         self.ducking = False
         self.is_player_remote = False   # when dev is remote control instance
         self.mouth_text = None
-        self.librespot_starting = False
+        # Cleared while librespot is starting, see launch_librespot()
+        self.librespot_ready = Event()
+        self.librespot_ready.set()
         self.librespot_failed = False
+        self.speech_done = Event()  # Set at the end of Mycroft's speech
+        # Track position at the last status poll, see next_monitor_poll()
+        self.monitor_position = None
 
-        self.__device_list = None
-        self.__devices_fetched = 0
+        self.device_registry = DeviceRegistry()
         self.OAUTH_ID = 1
         enclosure_config = self.config_core.get('enclosure')
         self.platform = enclosure_config.get('platform', 'unknown')
         self.DEFAULT_VOLUME = 80 if self.platform == 'mycroft_mark_1' else 100
-        self._playlists = None
+        self.user_playlists = None
         self.saved_tracks = None
+        self.saved_albums = None
+        self.prefetcher = None
+        self.library_index = LibraryIndex()
         self.regexes = {}
+        self.compiled_regexes = {}
+        self._query_patterns = None
         self.last_played_type = None  # The last uri type that was started
         self.is_playing = False
-        self.__saved_tracks_fetched = 0
         self.allow_master_control = self.settings.get('allow_master_control')
+        self._search_pool = None
+        self.cache = None
 
     def translate_regex(self, regex):
+        """Pattern from the locale's regex file, None if there's none."""
         if regex not in self.regexes:
             path = self.find_resource(regex + '.regex')
+            string = None
             if path:
                 with open(path) as f:
                     string = f.read().strip()
-                self.regexes[regex] = string
+            self.regexes[regex] = string
         return self.regexes[regex]
 
+    def compiled_regex(self, regex):
+        """Compiled case insensitive pattern from the locale's regex file,
+        None if there's no (valid) regex file.
+        """
+        if regex not in self.compiled_regexes:
+            pattern = self.translate_regex(regex)
+            compiled = None
+            if pattern:
+                try:
+                    compiled = re.compile(pattern, re.IGNORECASE)
+                except re.error as e:
+                    self.log.error('Invalid {}.regex ({})'.format(regex, e))
+            self.compiled_regexes[regex] = compiled
+        return self.compiled_regexes[regex]
+
+    @property
+    def query_patterns(self):
+        """The locale's specific query patterns, compiled on first use.
+
+        See query_patterns.QueryPatterns.
+        """
+        if self._query_patterns is None:
+            patterns = QueryPatterns({kind: self.translate_regex(kind)
+                                      for kind in QUERY_KINDS})
+            for kind, error in patterns.errors.items():
+                self.log.error('Invalid {}.regex ({})'.format(kind, error))
+            self._query_patterns = patterns
+        return self._query_patterns
+
     def launch_librespot(self):
-        """Launch the librespot binary for the Mark-1."""
-        self.librespot_starting = True
+        """Launch the librespot binary for the Mark-1.
+
+        librespot_ready is cleared until librespot's device is registered
+        with Spotify, librespot has failed or LIBRESPOT_START_TIMEOUT has
+        passed.
+        """
+        self.librespot_ready.clear()
+        try:
+            self._launch_librespot()
+        finally:
+            self.librespot_ready.set()
+
+    def _launch_librespot(self):
         path = self.settings.get('librespot_path', None)
         if self.platform in MANAGED_PLATFORMS and not path:
             path = 'librespot'
@@ -196,27 +324,56 @@ class SpotifySkill(CommonPlaySkill):
             else:
                 outs = DEVNULL
 
+            self.librespot.nice = int_setting(self.settings, 'librespot_nice')
+            self.librespot.ionice_class = int_setting(self.settings,
+                                                      'librespot_ionice_class')
+            self.librespot.ionice_level = int_setting(self.settings,
+                                                      'librespot_ionice_level')
             # TODO: Error message when provided username/password don't work
-            self.process = Popen([path, '-n', self.device_name,
-                                  '-u', self.settings['user'],
-                                  '-p', self.settings['password']],
-                                 stdout=outs, stderr=outs)
+            process = self.librespot.start([path, '-n', self.device_name,
+                                            '-u', self.settings['user'],
+                                            '-p', self.settings['password']],
+                                           outs)
 
-            time.sleep(3)  # give libreSpot time to start-up
-            if self.process and self.process.poll() is not None:
+            dev = self.wait_for_librespot_device(process)
+            if process.poll() is not None:
                 self.log.error('librespot failed to start.')
                 # libreSpot shut down immediately.  Bad user/password?
                 if self.settings.get('user'):
                     self.librespot_failed = True
-                self.process = None
-                self.librespot_starting = False
                 return
 
             # Lower the volume since max volume sounds terrible on the Mark-1
-            dev = self.device_by_name(self.device_name)
             if dev:
                 self.spotify.volume(dev['id'], self.DEFAULT_VOLUME)
-        self.librespot_starting = False
+            else:
+                self.log.warning('librespot device not registered within '
+                                 '{}s'.format(LIBRESPOT_START_TIMEOUT))
+
+    def wait_for_librespot_device(self, process):
+        """Wait for the librespot device to be registered with Spotify.
+
+        The device list is polled until the device is found, librespot
+        exits or LIBRESPOT_START_TIMEOUT has passed.
+
+        Arguments:
+            process (Popen): the librespot process
+
+        Returns:
+            (dict) the device, None if not found
+        """
+        deadline = time.monotonic() + LIBRESPOT_START_TIMEOUT
+        while process.poll() is None:
+            # The device has been added
+            self.device_registry.invalidate()
+            devices = self.devices
+            for dev in devices:
+                if dev['name'] == self.device_name:
+                    return dev
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(LIBRESPOT_POLL_INTERVAL)
+        return None
 
     def initialize(self):
         # Make sure the spotify login scheduled event is shutdown
@@ -227,6 +384,11 @@ class SpotifySkill(CommonPlaySkill):
         self.add_event('mycroft.audio.service.prev', self.prev_track)
         self.add_event('mycroft.audio.service.pause', self.pause)
         self.add_event('mycroft.audio.service.resume', self.resume)
+        self.add_event('recognizer_loop:audio_output_end',
+                       self.handle_audio_output_end)
+        self.add_event('spotify.librespot.stats',
+                       self.handle_librespot_stats)
+        self.add_event('spotify.metrics', self.handle_metrics)
         # Check and then monitor for credential changes
         self.settings_change_callback = self.on_websettings_changed
         # Retry in 5 minutes
@@ -234,6 +396,20 @@ class SpotifySkill(CommonPlaySkill):
                                       None, 5 * 60, name='SpotifyLogin')
         if self.platform in MANAGED_PLATFORMS:
             update_librespot()
+        # Searches and library data are kept across restarts
+        ensure_auth_dir_exists()
+        self.cache = PersistentCache(join(AUTH_DIR, 'cache.db'))
+        self.saved_tracks = SavedTracks(self.cache)
+        self.saved_albums = SavedAlbums(self.cache)
+        self.user_playlists = UserPlaylists(
+            self.cache, on_change=self.update_library_index)
+        self.prefetcher = Prefetcher(self.cache)
+        self.prefetcher.load()
+        self.schedule_repeating_event(self.prefetch, None, PREFETCH_INTERVAL,
+                                      name='SpotifyPrefetch')
+        self.schedule_repeating_event(self.compact_cache, None,
+                                      CACHE_COMPACT_INTERVAL,
+                                      name='SpotifyCacheCompaction')
         self.on_websettings_changed()
 
     def on_websettings_changed(self):
@@ -251,16 +427,21 @@ class SpotifySkill(CommonPlaySkill):
                     self.stop_librespot()
                 self.launch_librespot()
 
-            # Refresh saved tracks
-            # We can't get this list when the user asks because it takes
+            self.update_keep_warm()
+            self.update_metrics_file()
+            self.update_tracing()
+            # Refresh saved tracks and playlists
+            # We can't get these lists when the user asks because it takes
             # too long and causes
             # mycroft-playback-control.mycroftai:PlayQueryTimeout
+            self.user_playlists.refresh_async(self.spotify)
             self.refresh_saved_tracks()
 
     def load_local_creds(self):
         try:
             creds = load_local_credentials(self.settings['user'])
-            spotify = SpotifyConnect(client_credentials_manager=creds)
+            spotify = SpotifyConnect(client_credentials_manager=creds,
+                                     persistent_cache=self.cache)
         except Exception:
             self.log.exception('Couldn\'t fetch credentials')
             spotify = None
@@ -269,7 +450,8 @@ class SpotifySkill(CommonPlaySkill):
     def load_remote_creds(self):
         try:
             creds = MycroftSpotifyCredentials(self.OAUTH_ID)
-            spotify = SpotifyConnect(client_credentials_manager=creds)
+            spotify = SpotifyConnect(client_credentials_manager=creds,
+                                     persistent_cache=self.cache)
         except HTTPError:
             self.log.info('Couldn\'t fetch credentials')
             spotify = None
@@ -295,6 +477,72 @@ class SpotifySkill(CommonPlaySkill):
             # been connected
             self.device_name = DeviceApi().get().get('name')
 
+    def update_keep_warm(self):
+        """Keep the API connection open if enabled in the settings.
+
+        Avoids the connection setup delay for the first request after the
+        skill has been idle, at the cost of a request every 45 seconds
+        while idle.
+        """
+        if self.settings.get('keep_connection_warm', False):
+            self.spotify.start_keep_warm()
+        else:
+            self.spotify.stop_keep_warm()
+
+    def update_metrics_file(self):
+        """Write the metrics to the metrics_file setting's path, if set.
+
+        The file is in the Prometheus text format, for the node exporter's
+        textfile collector.
+        """
+        self.cancel_scheduled_event('SpotifyMetrics')
+        if self.settings.get('metrics_file'):
+            self.schedule_repeating_event(self.write_metrics, None,
+                                          METRICS_INTERVAL,
+                                          name='SpotifyMetrics')
+
+    def update_tracing(self):
+        """Trace the query and playback stages to the trace_file setting's
+        path, if set. See tracing.py.
+        """
+        path = self.settings.get('trace_file')
+        if path:
+            TRACER.configure(path)
+        else:
+            TRACER.disable()
+
+    def metrics(self):
+        """API metrics, rate limiter, search cache and librespot counters.
+
+        Returns:
+            (dict) the metrics, empty parts if not connected
+        """
+        return {
+            'api': self.spotify.metrics.snapshot() if self.spotify else {},
+            'scheduler': self.spotify.scheduler.stats() if self.spotify
+            else {},
+            'search_cache': self.spotify.search_cache.stats() if self.spotify
+            else {},
+            'librespot': self.librespot.stats()
+        }
+
+    def write_metrics(self):
+        path = self.settings.get('metrics_file')
+        if not path or not self.spotify:
+            return
+        text = self.spotify.metrics.prometheus()
+        for name, stats in self.metrics().items():
+            if name != 'api':
+                text += prometheus_stats('spotify_' + name, stats)
+        try:
+            write_prometheus(path, text)
+        except OSError as e:
+            self.log.error('Could not write the metrics ({})'.format(repr(e)))
+
+    def handle_metrics(self, message):
+        """Respond with the metrics, see metrics()."""
+        self.bus.emit(message.response(self.metrics()))
+
     def failed_auth(self):
         if 'user' not in self.settings:
             self.log.error('Settings hasn\'t been received yet')
@@ -352,25 +600,73 @@ class SpotifySkill(CommonPlaySkill):
     # Mycroft display handling
 
     def start_monitor(self):
-        """Monitoring and current song display."""
-        # Clear any existing event
-        self.stop_monitor()
+        """Monitoring and current song display.
 
-        # Schedule a new one every 5 seconds to monitor/update display
-        self.schedule_repeating_event(self._update_display,
-                                      None, 5,
-                                      name='MonitorSpotify')
+        The status is polled when the current track is expected to end,
+        see next_monitor_poll().
+        """
+        self.monitor_position = None
+        self.schedule_monitor(MONITOR_POLL_INTERVAL)
         self.add_event('recognizer_loop:record_begin',
                        self.handle_listener_started)
 
+    def schedule_monitor(self, delay):
+        """Schedule the next status poll.
+
+        Arguments:
+            delay (float): time in seconds until the poll
+        """
+        # Clear any existing event
+        self.stop_monitor()
+        self.schedule_event(self._update_display, delay,
+                            name='MonitorSpotify')
+
     def stop_monitor(self):
         # Clear any existing event
         self.cancel_scheduled_event('MonitorSpotify')
 
+    def next_monitor_poll(self, status):
+        """Time in seconds until the status should be polled again.
+
+        The progress of the track is extrapolated from the last poll. When
+        the status matches it, the same track continuing or the next track
+        playing after the expected end, the next poll is just after the end
+        of the current track (at most MONITOR_MAX_INTERVAL). Otherwise, for
+        example after a seek or skip on another device, the status is
+        polled every MONITOR_POLL_INTERVAL until it's consistent again.
+
+        Arguments:
+            status (dict): Spotify status info
+
+        Returns:
+            (float) delay in seconds
+        """
+        now = time.monotonic()
+        position = track_position(status)
+        previous = self.monitor_position
+        self.monitor_position = (position, now) if position else None
+        if not position or not previous:
+            return MONITOR_POLL_INTERVAL
+
+        uri, progress, duration = position
+        (last_uri, last_progress, last_duration), polled = previous
+        expected = last_progress + now - polled
+        if uri == last_uri:
+            consistent = (abs(progress - expected) <=
+                          MONITOR_PROGRESS_TOLERANCE)
+        else:
+            consistent = (expected >=
+                          last_duration - MONITOR_PROGRESS_TOLERANCE)
+        if not consistent:
+            return MONITOR_POLL_INTERVAL
+        remaining = max(duration - progress, 0)
+        return min(remaining + MONITOR_TRACK_END_MARGIN, MONITOR_MAX_INTERVAL)
+
     def _update_display(self, message):
-        # Checks once a second for feedback
-        status = self.spotify.status() if self.spotify else {}
-        self.is_playing = self.spotify.is_playing()
+        # Polled when the track is expected to change, see start_monitor()
+        with request_lane(BACKGROUND):
+            status = self.spotify.status() if self.spotify else {}
+            self.is_playing = self.spotify.is_playing()
 
         if not status or not status.get('is_playing'):
             self.stop_monitor()
@@ -407,6 +703,9 @@ class SpotifySkill(CommonPlaySkill):
             self.mouth_text = text
             self.enclosure.mouth_text(text)
 
+        self.schedule_monitor(self.next_monitor_poll(status))
+
+    @TRACER.traced(arguments=('phrase',), result=match_attributes)
     def CPS_match_query_phrase(self, phrase):
         """Handler for common play framework Query."""
         # Not ready to play
@@ -419,8 +718,9 @@ class SpotifySkill(CommonPlaySkill):
 
         spotify_specified = 'spotify' in phrase
         bonus = 0.1 if spotify_specified else 0.0
-        phrase = re.sub(self.translate_regex('on_spotify'), '', phrase,
-                        re.IGNORECASE)
+        on_spotify = self.compiled_regex('on_spotify')
+        if on_spotify:
+            phrase = on_spotify.sub('', phrase)
 
         confidence, data = self.continue_playback(phrase, bonus)
         if not data:
@@ -464,6 +764,7 @@ class SpotifySkill(CommonPlaySkill):
         else:
             self.log.debug('Couldn\'t find anything to play on Spotify')
 
+    @TRACER.traced(result=query_attributes)
     def continue_playback(self, phrase, bonus):
         if phrase.strip() == 'spotify':
             return (1.0,
@@ -475,12 +776,14 @@ class SpotifySkill(CommonPlaySkill):
         else:
             return NOTHING_FOUND
 
+    @TRACER.traced(result=query_attributes)
     def specific_query(self, phrase, bonus):
         """
         Check if the phrase can be matched against a specific spotify request.
 
         This includes asking for saved items, playlists, albums, podcasts,
-        artists or songs.
+        artists or songs. The phrase is classified by the locale's patterns
+        in a single scan, see query_patterns.py.
 
         Arguments:
             phrase (str): Text to match against
@@ -488,56 +791,59 @@ class SpotifySkill(CommonPlaySkill):
 
         Returns: Tuple with confidence and data or NOTHING_FOUND
         """
-        # Check if saved
-        match = re.match(self.translate_regex('saved_songs'), phrase,
-                         re.IGNORECASE)
-        if match and self.saved_tracks:
+        # The saved songs are only matched if there are any
+        skip = () if self.saved_tracks else ('saved_songs',)
+        kind, groups = self.query_patterns.match(phrase, skip)
+        if kind == 'saved_songs':
             return (1.0, {'data': None,
                           'type': 'saved_tracks'})
-
-        # Check if playlist
-        match = re.match(self.translate_regex('playlist'), phrase,
-                         re.IGNORECASE)
-        if match:
-            return self.query_playlist(match.groupdict()['playlist'])
-
-        # Check album
-        match = re.match(self.translate_regex('album'), phrase,
-                         re.IGNORECASE)
-        if match:
+        elif kind == 'playlist':
+            return self.query_playlist(groups['playlist'])
+        elif kind == 'album':
             bonus += 0.1
-            album = match.groupdict()['album']
+            album = groups['album']
+            confidence, data = self.query_library(album, ('album',), bonus)
+            if data:
+                return confidence, data
             return self.query_album(album, bonus)
-
-        # Check artist
-        match = re.match(self.translate_regex('artist'), phrase,
-                         re.IGNORECASE)
-        if match:
-            artist = match.groupdict()['artist']
+        elif kind == 'artist':
+            artist = groups['artist']
+            confidence, data = self.query_library(artist, ('artist',), bonus)
+            if data:
+                return confidence, data
             return self.query_artist(artist, bonus)
-        match = re.match(self.translate_regex('song'), phrase,
-                         re.IGNORECASE)
-        if match:
-            song = match.groupdict()['track']
+        elif kind == 'song':
+            song = groups['track']
+            confidence, data = self.query_library(song, ('track',), bonus)
+            if data:
+                return confidence, data
             return self.query_song(song, bonus)
-
-        # Check if podcast
-        match = re.match(self.translate_regex('podcast'), phrase,
-                         re.IGNORECASE)
-        if match:
-            return self.query_show(match.groupdict()['podcast'])
+        elif kind == 'podcast':
+            return self.query_show(groups['podcast'])
 
         return NOTHING_FOUND
 
+    @TRACER.traced(result=query_attributes)
     def generic_query(self, phrase, bonus):
         """Check for a generic query, not asking for any special feature.
 
         This will try to parse the entire phrase in the following order
         - As a user playlist
-        - As an album
+        - As an artist
         - As a track
+        - As an album
         - As a public playlist
 
+        The searches are started concurrently unless the concurrent_search
+        setting is disabled, the result is the same in both cases.
+
+        Unless the combined_search setting is disabled the artists, tracks,
+        albums and public playlists are fetched using a single search
+        request and scored locally.
+
+        Before any of that the user's library is checked, see
+        query_library().
+
         Arguments:
             phrase (str): Text to match against
             bonus (float): Any existing match bonus
@@ -545,67 +851,141 @@ class SpotifySkill(CommonPlaySkill):
         Returns: Tuple with confidence and data or NOTHING_FOUND
         """
         self.log.info('Handling "{}" as a genric query...'.format(phrase))
+        confidence, data = self.query_library(phrase, LIBRARY_KINDS, bonus)
+        if data:
+            return confidence, data
+
+        if self.settings.get('combined_search', True):
+            searches = self.search_pool.submit(
+                TRACER.propagate(self.combined_search), phrase)
+        else:
+            searches = None
+
+        def searched(search_type):
+            # Prefetched search result for the type, None if not available
+            return searches.result().get(search_type) if searches else None
+
+        queries = [
+            ('users playlists', lambda: self.query_user_playlist(phrase)),
+            ('artists',
+             lambda: self.query_artist(phrase, bonus, searched('artist'))),
+            ('tracks',
+             lambda: self.query_song(phrase, bonus, searched('track'))),
+            ('albums',
+             lambda: self.query_album(phrase, bonus, searched('album'))),
+            ('public playlists',
+             lambda: self.get_best_public_playlist(phrase,
+                                                   searched('playlist')))
+        ]
+        if self.settings.get('concurrent_search', True):
+            return self.run_queries_concurrently(queries)
+        else:
+            return self.run_queries(queries)
+
+    @TRACER.traced()
+    def combined_search(self, phrase):
+        """Search artists, tracks, albums and playlists in one request.
+
+        Phrases containing the "by" word are skipped since track and album
+        searches for those are refined by artist.
+
+        Arguments:
+            phrase (str): Text to search for
+
+        Returns:
+            (dict) search result per type (in the same format as a search
+            for that single type), empty if nothing was searched.
+        """
+        by_word = ' {} '.format(self.translate('by'))
+        if by_word in phrase:
+            return {}
+
+        search_types = ','.join(COMBINED_SEARCH_TYPES)
+        data = self.spotify.search(phrase, type=search_types)
+        if not data:
+            return {}
+        results = {}
+        for search_type in COMBINED_SEARCH_TYPES:
+            key = search_type + 's'
+            if key in data:
+                results[search_type] = {key: data[key]}
+        return results
+
+    @property
+    def search_pool(self):
+        """Bounded worker pool used for concurrent searches."""
+        if not self._search_pool:
+            self._search_pool = ThreadPoolExecutor(
+                max_workers=MAX_SEARCH_WORKERS,
+                thread_name_prefix='SpotifySearch')
+        return self._search_pool
+
+    def run_queries(self, queries):
+        """Run queries one after another.
+
+        The first result above DIRECT_RESPONSE_CONFIDENCE is returned
+        directly, otherwise the best result above MATCH_CONFIDENCE.
+
+        Arguments:
+            queries (list): list of (name, callable) tuples, in priority order
+
+        Returns: Tuple with confidence and data or NOTHING_FOUND
+        """
         results = []
+        for name, query in queries:
+            self.log.info('Checking {}'.format(name))
+            conf, data = query()
+            if conf and conf > DIRECT_RESPONSE_CONFIDENCE:
+                return conf, data
+            elif conf and conf > MATCH_CONFIDENCE:
+                results.append((conf, data))
+        return best_result(results)
+
+    def run_queries_concurrently(self, queries):
+        """Run queries on the search pool.
 
-        self.log.info('Checking users playlists')
-        playlist, conf = self.get_best_user_playlist(phrase)
-        if playlist:
-            uri = self.playlists[playlist]
-            data = {
-                        'data': uri,
-                        'name': playlist,
-                        'type': 'playlist'
-                   }
-        if conf and conf > DIRECT_RESPONSE_CONFIDENCE:
-            return (conf, data)
-        elif conf and conf > MATCH_CONFIDENCE:
-            results.append((conf, data))
-
-        # Check for artist
-        self.log.info('Checking artists')
-        conf, data = self.query_artist(phrase, bonus)
-        if conf and conf > DIRECT_RESPONSE_CONFIDENCE:
-            return conf, data
-        elif conf and conf > MATCH_CONFIDENCE:
-            results.append((conf, data))
-
-        # Check for track
-        self.log.info('Checking tracks')
-        conf, data = self.query_song(phrase, bonus)
-        if conf and conf > DIRECT_RESPONSE_CONFIDENCE:
-            return conf, data
-        elif conf and conf > MATCH_CONFIDENCE:
-            results.append((conf, data))
-
-        # Check for album
-        self.log.info('Checking albums')
-        conf, data = self.query_album(phrase, bonus)
-        if conf and conf > DIRECT_RESPONSE_CONFIDENCE:
-            return conf, data
-        elif conf and conf > MATCH_CONFIDENCE:
-            results.append((conf, data))
-
-        # Check for public playlist
-        self.log.info('Checking tracks')
-        conf, data = self.get_best_public_playlist(phrase)
-        if conf and conf > DIRECT_RESPONSE_CONFIDENCE:
-            return conf, data
-        elif conf and conf > MATCH_CONFIDENCE:
-            results.append((conf, data))
+        All queries are started at once but the results are evaluated in
+        priority order, exactly like run_queries(). As soon as a query above
+        DIRECT_RESPONSE_CONFIDENCE is found (and all queries before it are
+        done) it's returned and the remaining queries are cancelled or, if
+        already running, ignored.
+
+        Arguments:
+            queries (list): list of (name, callable) tuples, in priority order
 
+        Returns: Tuple with confidence and data or NOTHING_FOUND
+        """
+        futures = [self.search_pool.submit(TRACER.propagate(query))
+                   for _, query in queries]
+        results = []
+        try:
+            for (name, _), future in zip(queries, futures):
+                self.log.info('Checking {}'.format(name))
+                conf, data = future.result()
+                if conf and conf > DIRECT_RESPONSE_CONFIDENCE:
+                    return conf, data
+                elif conf and conf > MATCH_CONFIDENCE:
+                    results.append((conf, data))
+        finally:
+            for future in futures:
+                future.cancel()
         return best_result(results)
 
-    def query_artist(self, artist, bonus=0.0):
+    @TRACER.traced(arguments=('artist',), result=query_attributes)
+    def query_artist(self, artist, bonus=0.0, data=None):
         """Try to find an artist.
 
         Arguments:
             artist (str): Artist to search for
             bonus (float): Any bonus to apply to the confidence
+            data (dict): Already fetched artist search result, if None
+                         Spotify will be searched
 
         Returns: Tuple with confidence and data or NOTHING_FOUND
         """
         bonus += 0.1
-        data = self.spotify.search(artist, type='artist')
+        if data is None:
+            data = self.spotify.search(artist, type='artist')
         if data and data['artists']['items']:
             best = data['artists']['items'][0]['name']
             confidence = fuzzy_match(best, artist.lower()) + bonus
@@ -619,7 +999,51 @@ class SpotifySkill(CommonPlaySkill):
         else:
             return NOTHING_FOUND
 
-    def query_album(self, album, bonus):
+    @TRACER.traced(arguments=('query',), result=query_attributes)
+    def query_library(self, query, kinds, bonus=0.0):
+        """Try to find something in the user's library.
+
+        The local library index is searched without calling the Spotify
+        API, only confident matches are returned. This can be turned off
+        using the local_library_search setting.
+
+        Arguments:
+            query (str): Text to search for
+            kinds (tuple): kinds of items to search for, see LIBRARY_KINDS
+            bonus (float): Any bonus to apply to the confidence
+
+        Returns: Tuple with confidence and data or NOTHING_FOUND
+        """
+        if not self.settings.get('local_library_search', True):
+            return NOTHING_FOUND
+        confidence, kind, item = self.library_index.search(query.lower(),
+                                                           kinds)
+        if confidence > DIRECT_RESPONSE_CONFIDENCE:
+            self.log.info('Found {} in library ({})'.format(kind, confidence))
+            if kind == 'artist':
+                bonus += 0.1  # Same as query_artist()
+            return (min(confidence + bonus, 1.0),
+                    library_result(kind, item))
+        return NOTHING_FOUND
+
+    @TRACER.traced(arguments=('playlist',), result=query_attributes)
+    def query_user_playlist(self, playlist):
+        """Try to find a playlist among the user's playlists.
+
+        Arguments:
+            playlist (str): Playlist to search for
+
+        Returns: Tuple with confidence and data or NOTHING_FOUND
+        """
+        key, data, conf = self.get_best_user_playlist(playlist)
+        if key:
+            return (conf, {'data': data,
+                           'name': key,
+                           'type': 'playlist'})
+        return NOTHING_FOUND
+
+    @TRACER.traced(arguments=('album',), result=query_attributes)
+    def query_album(self, album, bonus, data=None):
         """Try to find an album.
 
         Searches Spotify by album and artist if available.
@@ -627,10 +1051,11 @@ class SpotifySkill(CommonPlaySkill):
         Arguments:
             album (str): Album to search for
             bonus (float): Any bonus to apply to the confidence
+            data (dict): Already fetched album search result, if None
+                         Spotify will be searched
 
         Returns: Tuple with confidence and data or NOTHING_FOUND
         """
-        data = None
         by_word = ' {} '.format(self.translate('by'))
         if len(album.split(by_word)) > 1:
             album, artist = album.split(by_word)
@@ -638,7 +1063,8 @@ class SpotifySkill(CommonPlaySkill):
             bonus += 0.1
         else:
             album_search = album
-        data = self.spotify.search(album_search, type='album')
+        if data is None:
+            data = self.spotify.search(album_search, type='album')
         if data and data['albums']['items']:
             best = data['albums']['items'][0]['name'].lower()
             confidence = best_confidence(best, album)
@@ -654,6 +1080,7 @@ class SpotifySkill(CommonPlaySkill):
                     })
         return NOTHING_FOUND
 
+    @TRACER.traced(arguments=('playlist',), result=query_attributes)
     def query_playlist(self, playlist):
         """Try to find a playlist.
 
@@ -665,15 +1092,15 @@ class SpotifySkill(CommonPlaySkill):
 
         Returns: Tuple with confidence and data or NOTHING_FOUND
         """
-        result, conf = self.get_best_user_playlist(playlist)
+        _, uri, conf = self.get_best_user_playlist(playlist)
         if playlist and conf > 0.5:
-            uri = self.playlists[result]
             return (conf, {'data': uri,
                            'name': playlist,
                            'type': 'playlist'})
         else:
             return self.get_best_public_playlist(playlist)
 
+    @TRACER.traced(arguments=('podcast',), result=query_attributes)
     def query_show(self, podcast):
         """Try to find a podcast.
 
@@ -691,7 +1118,8 @@ class SpotifySkill(CommonPlaySkill):
             confidence = best_confidence(best, podcast)
             return (confidence, {'data': data, 'type': 'show'})
 
-    def query_song(self, song, bonus):
+    @TRACER.traced(arguments=('song',), result=query_attributes)
+    def query_song(self, song, bonus, data=None):
         """Try to find a song.
 
         Searches Spotify for song and artist if provided.
@@ -699,10 +1127,11 @@ class SpotifySkill(CommonPlaySkill):
         Arguments:
             song (str): Song to search for
             bonus (float): Any bonus to apply to the confidence
+            data (dict): Already fetched track search result, if None
+                         Spotify will be searched
 
         Returns: Tuple with confidence and data or NOTHING_FOUND
         """
-        data = None
         by_word = ' {} '.format(self.translate('by'))
         if len(song.split(by_word)) > 1:
             song, artist = song.split(by_word)
@@ -710,10 +1139,16 @@ class SpotifySkill(CommonPlaySkill):
         else:
             song_search = song
 
-        data = self.spotify.search(song_search, type='track')
+        if data is None:
+            data = self.spotify.search(song_search, type='track')
         if data and len(data['tracks']['items']) > 0:
-            tracks = [(best_confidence(d['name'], song), d)
-                      for d in data['tracks']['items']]
+            items = data['tracks']['items']
+            # Tracks not within 0.1 of the best match are dropped below,
+            # they don't need to be fully scored.
+            scores = Candidates([d['name'] for d in items],
+                                strip=True).best_confidences(song, 0.1)
+            tracks = [(score, d) for score, d in zip(scores, items)
+                      if score is not None]
             tracks.sort(key=lambda x: x[0])
             tracks.reverse()  # Place best matches first
             # Find pretty similar tracks to the best match
@@ -728,34 +1163,27 @@ class SpotifySkill(CommonPlaySkill):
         else:
             return NOTHING_FOUND
 
+    @TRACER.traced(arguments=('phrase',))
     def CPS_start(self, phrase, data):
         """Handler for common play framework start playback request."""
         try:
             if not self.spotify:
                 raise SpotifyNotAuthorizedError
             # Wait for librespot to start
-            if self.librespot_starting:
+            if not self.librespot_ready.is_set():
                 self.log.info('Restarting Librespot...')
-                for i in range(10):
-                    time.sleep(0.5)
-                    if not self.librespot_starting:
-                        break
-                else:
+                if not self.librespot_ready.wait(LIBRESPOT_START_TIMEOUT):
                     self.log.error('LIBRESPOT NOT STARTED')
 
-            dev = self.get_default_device()
-            if not dev:
-                raise NoSpotifyDevicesError
-
+            # The confirmation is given once the device is known
             if data['type'] == 'continue':
-                self.acknowledge()
-                self.continue_current_playlist(dev)
+                self.continue_current_playlist(None, acknowledge=True)
             elif data['type'] == 'playlist':
-                self.start_playlist_playback(dev, data['name'],
+                self.start_playlist_playback(None, data['name'],
                                              data['data'])
             else:  # artist, album track
                 self.log.info('playing {}'.format(data['type']))
-                self.play(dev, data=data['data'], data_type=data['type'])
+                self.play(None, data=data['data'], data_type=data['type'])
             self.enable_playing_intents()
             if data.get('type') and data['type'] != 'continue':
                 self.last_played_type = data['type']
@@ -809,48 +1237,82 @@ class SpotifySkill(CommonPlaySkill):
 
     @property
     def playlists(self):
-        """Playlists, cached for 5 minutes."""
+        """Playlists by lower case name.
+
+        The playlists are refreshed in the background every 5 minutes, this
+        never waits for the network, see library.UserPlaylists.
+        """
         if not self.spotify:
             return []  # No connection, no playlists
-        now = time.time()
-        if not self._playlists or (now - self.__playlists_fetched > 5 * 60):
-            self._playlists = {}
-            playlists = self.spotify.current_user_playlists().get('items', [])
-            for p in playlists:
-                self._playlists[p['name'].lower()] = p
-            self.__playlists_fetched = now
-        return self._playlists
+        return self.user_playlists.get(self.spotify)
 
     def refresh_saved_tracks(self):
-        """Saved tracks are cached for 4 hours."""
+        """Saved tracks and albums are synchronised every 4 hours.
+
+        Only tracks added since the last sync are fetched, see
+        library.SavedTracks. The tracks are also stored in the persistent
+        cache so a restart doesn't cause the library to be downloaded again.
+        """
         if not self.spotify:
             return []
+        if not self.saved_tracks.synced:
+            self.saved_tracks.load()
+            self.saved_albums.load()
         now = time.time()
-        if (not self.saved_tracks or
-                (now - self.__saved_tracks_fetched > 4 * 60 * 60)):
-            saved_tracks = []
-            offset = 0
-            while True:
-                batch = self.spotify.current_user_saved_tracks(50, offset)
-                for item in batch.get('items', []):
-                    saved_tracks.append(item['track'])
-                offset += 50
-                if not batch['next']:
-                    break
-
-            self.saved_tracks = saved_tracks
-            self.__saved_tracks_fetched = now
+        with request_lane(BACKGROUND):
+            if now - self.saved_tracks.synced > 4 * 60 * 60:
+                self.saved_tracks.sync(self.spotify)
+            if now - self.saved_albums.synced > 4 * 60 * 60:
+                self.saved_albums.sync(self.spotify)
+        self.update_library_index()
+
+    def prefetch(self):
+        """Prefetch the user's top artists and tracks when idle.
+
+        The top artists and tracks are added to the library index and
+        searched to have the results cached, within the prefetch_budget
+        setting (requests per hour, 60 by default, 0 disables prefetching).
+        See prefetch.Prefetcher.
+        """
+        budget = int_setting(self.settings, 'prefetch_budget')
+        self.prefetcher.budget = DEFAULT_BUDGET if budget is None else budget
+        if (not self.spotify or not self.prefetcher.budget or
+                time.monotonic() - self.spotify.last_api_request <
+                PREFETCH_IDLE_TIME):
+            return
+        try:
+            # Warm the cache of the search made by generic_query()
+            if self.prefetcher.run(self.spotify, self.combined_search):
+                self.update_library_index()
+        except Exception as e:
+            self.log.error('Prefetching failed ({})'.format(repr(e)))
+
+    def compact_cache(self):
+        """Shrink the persistent cache, see cache.PersistentCache.compact().
+
+        The cache can't be read during the compaction, it's postponed to
+        the next hour while the skill is in use.
+        """
+        if (self.spotify and
+                time.monotonic() - self.spotify.last_api_request <
+                PREFETCH_IDLE_TIME):
+            return
+        self.cache.compact()
+
+    def update_library_index(self):
+        """Rebuild the local library index if the library has changed."""
+        self.library_index.update(self.saved_tracks, self.saved_albums,
+                                  self.user_playlists, self.prefetcher)
 
     @property
     def devices(self):
-        """Devices, cached for 60 seconds."""
+        """Devices, refreshed in the background every 60 seconds.
+
+        See devices.DeviceRegistry.
+        """
         if not self.spotify:
             return []  # No connection, no devices
-        now = time.time()
-        if not self.__device_list or (now - self.__devices_fetched > 60):
-            self.__device_list = self.spotify.get_devices()
-            self.__devices_fetched = now
-        return self.__device_list
+        return self.device_registry.get(self.spotify)
 
     def device_by_name(self, name):
         """Get a Spotify devices from the API.
@@ -860,74 +1322,96 @@ class SpotifySkill(CommonPlaySkill):
         Returns:
             (dict) None or the matching device's description
         """
-        devices = self.devices
-        if devices and len(devices) > 0:
-            # Otherwise get a device with the selected name
-            devices_by_name = {d['name'].lower(): d for d in devices}
-            key, confidence = match_one(name, list(devices_by_name.keys()))
-            if confidence > 0.5:
-                return devices_by_name[key]
-        return None
+        if not self.spotify:
+            return None
+        return self.device_registry.find(self.spotify, name)
 
+    @TRACER.traced()
     def get_default_device(self):
-        """Get preferred playback device."""
-        if self.spotify:
-            # If user has set config allowing skill to control other devices,
-            # first check if any devices are currently playing or recently have
-            # been playing (current_playback() will return info about the most
-            # recently played device for about 10 minutes after playback is
-            # paused, after which it will return None)
-            # If a device has been playing recently, use it as the default
-            # Otherwise continue with 'normal' procedure for choosing a default
-            if self.allow_master_control:
-                current_playback = self.spotify.current_playback()
-                if current_playback:
-                    device_name = current_playback['device']['name']
-                    device_id = current_playback['device']['id']
-                    self.log.debug(f'using device {device_name} as default, '
-                                   f'device id: {device_id}')
-                    return current_playback['device']
-
-            # When there is an active Spotify device somewhere, use it
-            if (self.devices and len(self.devices) > 0 and
-                    self.spotify.is_playing()):
-                for dev in self.devices:
-                    if dev['is_active']:
-                        self.log.info('Playing on an active device '
-                                      '[{}]'.format(dev['name']))
-                        return dev  # Use this device
-
-            # No playing device found, use the default Spotify device
-            default_device = self.settings.get('default_device', '')
-            dev = None
-            device_type = DeviceType.NOTFOUND
-            if default_device:
-                dev = self.device_by_name(default_device)
-                self.is_player_remote = True
-                device_type = DeviceType.DEFAULT
-            # if not set or missing try playing on this device
-            if not dev:
-                dev = self.device_by_name(self.device_name or '')
-                self.is_player_remote = False
-                device_type = DeviceType.MYCROFT
-            # if not check if a desktop spotify client is playing
-            if not dev:
-                dev = self.device_by_name(gethostname())
-                self.is_player_remote = False
-                device_type = DeviceType.DESKTOP
-
-            # use first best device if none of the prioritized works
-            if not dev and len(self.devices) > 0:
-                dev = self.devices[0]
-                self.is_player_remote = True  # ?? Guessing it is remote
-                device_type = DeviceType.FIRSTBEST
-
-            if dev and not dev['is_active']:
-                self.spotify.transfer_playback(dev['id'], False)
-            self.log.info('Device detected: {}'.format(device_type))
-            return dev
+        """Get preferred playback device.
 
-        return None
+        Playback is transferred to the device if it isn't active, so it can
+        be controlled (paused, skipped...). To start playback use
+        resolve_device(), playing on a device transfers playback to it.
+        """
+        choice = self.resolve_device()
+        if choice.needs_transfer:
+            self.spotify.transfer_playback(choice.device['id'], False)
+            self.device_registry.invalidate()
+        return choice.device
+
+    @TRACER.traced(result=device_attributes)
+    def resolve_device(self):
+        """Choose the device to play on.
+
+        The playback state and the device list are fetched concurrently.
+
+        Returns:
+            (DeviceChoice) the chosen device, if any
+        """
+        if not self.spotify:
+            return DeviceChoice(None, DeviceType.NOTFOUND, False)
+
+        status = self.search_pool.submit(
+            TRACER.propagate(self.spotify.status))
+        devices = self.search_pool.submit(
+            TRACER.propagate(lambda: self.devices))
+        status.result()  # Shared by current_playback() and is_playing()
+        devices = devices.result()
+
+        # If user has set config allowing skill to control other devices,
+        # first check if any devices are currently playing or recently have
+        # been playing (current_playback() will return info about the most
+        # recently played device for about 10 minutes after playback is
+        # paused, after which it will return None)
+        # If a device has been playing recently, use it as the default
+        # Otherwise continue with 'normal' procedure for choosing a default
+        if self.allow_master_control:
+            current_playback = self.spotify.current_playback()
+            if current_playback:
+                device_name = current_playback['device']['name']
+                device_id = current_playback['device']['id']
+                self.log.debug(f'using device {device_name} as default, '
+                               f'device id: {device_id}')
+                return DeviceChoice(current_playback['device'],
+                                    DeviceType.PLAYING, self.is_player_remote)
+
+        # When there is an active Spotify device somewhere, use it
+        if devices and len(devices) > 0 and self.spotify.is_playing():
+            for dev in devices:
+                if dev['is_active']:
+                    self.log.info('Playing on an active device '
+                                  '[{}]'.format(dev['name']))
+                    return DeviceChoice(dev, DeviceType.ACTIVE,
+                                        self.is_player_remote)
+
+        # No playing device found, use the default Spotify device
+        default_device = self.settings.get('default_device', '')
+        dev = None
+        device_type = DeviceType.NOTFOUND
+        if default_device:
+            dev = self.device_by_name(default_device)
+            self.is_player_remote = True
+            device_type = DeviceType.DEFAULT
+        # if not set or missing try playing on this device
+        if not dev:
+            dev = self.device_by_name(self.device_name or '')
+            self.is_player_remote = False
+            device_type = DeviceType.MYCROFT
+        # if not check if a desktop spotify client is playing
+        if not dev:
+            dev = self.device_by_name(gethostname())
+            self.is_player_remote = False
+            device_type = DeviceType.DESKTOP
+
+        # use first best device if none of the prioritized works
+        if not dev and len(devices) > 0:
+            dev = devices[0]
+            self.is_player_remote = True  # ?? Guessing it is remote
+            device_type = DeviceType.FIRSTBEST
+
+        self.log.info('Device detected: {}'.format(device_type))
+        return DeviceChoice(dev, device_type, self.is_player_remote)
 
     def get_best_user_playlist(self, playlist):
         """Get best playlist matching the provided name
@@ -935,18 +1419,28 @@ class SpotifySkill(CommonPlaySkill):
         Arguments:
             playlist (str): Playlist name
 
-        Returns: ((str)best match, (float)confidence)
+        Returns: ((str)best match, (dict)playlist, (float)confidence)
         """
-        playlists = list(self.playlists.keys())
-        if len(playlists) > 0:
-            # Only check if the user has playlists
-            key, confidence = match_one(playlist.lower(), playlists)
+        if self.spotify:
+            key, data, confidence = self.user_playlists.find(self.spotify,
+                                                             playlist)
             if confidence > 0.7:
-                return key, confidence
-        return NOTHING_FOUND
+                return key, data, confidence
+        return None, None, 0.0
 
-    def get_best_public_playlist(self, playlist):
-        data = self.spotify.search(playlist, type='playlist')
+    @TRACER.traced(arguments=('playlist',), result=query_attributes)
+    def get_best_public_playlist(self, playlist, data=None):
+        """Get best public playlist matching the provided name.
+
+        Arguments:
+            playlist (str): Playlist name
+            data (dict): Already fetched playlist search result, if None
+                         Spotify will be searched
+
+        Returns: Tuple with confidence and data or NOTHING_FOUND
+        """
+        if data is None:
+            data = self.spotify.search(playlist, type='playlist')
         if data and data['playlists']['items']:
             best = data['playlists']['items'][0]
             confidence = fuzzy_match(best['name'].lower(), playlist)
@@ -956,9 +1450,21 @@ class SpotifySkill(CommonPlaySkill):
                                      'type': 'playlist'})
         return NOTHING_FOUND
 
-    def continue_current_playlist(self, dev):
-        """Send the play command to the selected device."""
-        time.sleep(2)
+    def continue_current_playlist(self, dev, acknowledge=False):
+        """Send the play command to the selected device.
+
+        Arguments:
+            dev (dict): device to play on, if None the default device is
+                        used
+            acknowledge (bool): play the acknowledge sound when the device
+                                is known
+        """
+        # Playing on the device transfers playback to it
+        dev = dev or self.resolve_device().device
+        if not dev:
+            raise NoSpotifyDevicesError
+        if acknowledge:
+            self.acknowledge()
         self.spotify_play(dev['id'])
 
     def playback_prerequisits_ok(self):
@@ -970,12 +1476,12 @@ class SpotifySkill(CommonPlaySkill):
         if self.process and self.device_name not in devs:
             self.log.info('Librespot not responding, restarting...')
             self.stop_librespot()
-            self.__devices_fetched = 0  # Make sure devices are fetched again
         if not self.process:
             self.schedule_event(self.launch_librespot, 0,
                                 name='launch_librespot')
         return True
 
+    @TRACER.traced(arguments=('dev_id',))
     def spotify_play(self, dev_id, uris=None, context_uri=None):
         """Start spotify playback and log any exceptions."""
         try:
@@ -988,6 +1494,10 @@ class SpotifySkill(CommonPlaySkill):
             if e.http_status == 403:
                 self.log.error('Play command returned 403, play is likely '
                                'already in progress. \n {}'.format(repr(e)))
+            elif e.http_status == 404:
+                # The device is gone, fetch the current devices next time
+                self.device_registry.invalidate()
+                raise NoSpotifyDevicesError from e
             else:
                 raise SpotifyNotAuthorizedError from e
         except Exception as e:
@@ -995,17 +1505,24 @@ class SpotifySkill(CommonPlaySkill):
             raise
 
     def start_playlist_playback(self, dev, name, uri):
+        """Play a playlist when its name has been spoken.
+
+        Arguments:
+            dev (dict): device to play on, if None the default device is
+                        used
+            name (str): playlist name
+            uri (dict): playlist data
+        """
         name = name.replace('|', ':')
         if uri:
-            self.log.info(u'playing {} using {}'.format(name, dev['name']))
-            self.speak_dialog('ListeningToPlaylist',
-                              data={'playlist': name})
-            time.sleep(2)
-            self.spotify_play(dev['id'], context_uri=uri['uri'])
+            self.log.info(u'playing {}'.format(name))
+            self.speak_then_play('ListeningToPlaylist', {'playlist': name},
+                                 dev, context_uri=uri['uri'])
         else:
             self.log.info('No playlist found')
             raise PlaylistNotFoundError
 
+    @TRACER.traced(arguments=('data_type',))
     def play(self, dev, data, data_type='track', genre_name=None):
         """
         Plays the provided data in the manner appropriate for 'data_type'
@@ -1018,7 +1535,12 @@ class SpotifySkill(CommonPlaySkill):
         A 'genre' expects data returned from self.spotify.search, and will use
         that genre to play a selection similar to it.
 
+        The playback is started when the dialog has been spoken, see
+        speak_then_play().
+
         Args:
+            dev (dict):         Device to play on, if None the default device
+                                is used
             data (dict):        Data returned by self.spotify.search
             data_type (str):    The type of data contained in the passed-in
                                 object. 'saved_tracks', 'track', 'album',
@@ -1027,60 +1549,90 @@ class SpotifySkill(CommonPlaySkill):
                                 name here, for output purposes. default None
         """
         try:
-            if data_type == 'saved_tracks':
-                # Grab 200 random songs
-                # Spotify doesn't like it when we send thousands of songs
-                items = random.sample(self.saved_tracks, 200)
-                uris = []
-                for item in items:
-                    uris.append(item['uri'])
-                self.speak_dialog('ListeningToSavedSongs')
-                time.sleep(2)
-                self.spotify_play(dev['id'], uris=uris)
-            elif data_type == 'track':
-                (song, artists, uri) = get_song_info(data)
-                self.speak_dialog('ListeningToSongBy',
-                                  data={'tracks': song,
-                                        'artist': artists[0]})
-                time.sleep(2)
-                self.spotify_play(dev['id'], uris=[uri])
-            elif data_type == 'artist':
-                (artist, uri) = get_artist_info(data)
-                self.speak_dialog('ListeningToArtist',
-                                  data={'artist': artist})
-                time.sleep(2)
-                self.spotify_play(dev['id'], context_uri=uri)
-            elif data_type == 'album':
-                (album, artists, uri) = get_album_info(data)
-                self.speak_dialog('ListeningToAlbumBy',
-                                  data={'album': album,
-                                        'artist': artists[0]})
-                time.sleep(2)
-                self.spotify_play(dev['id'], context_uri=uri)
-            elif data_type == 'genre':
-                items = data['tracks']['items']
-                random.shuffle(items)
-                uris = []
-                for item in items:
-                    uris.append(item['uri'])
-                data = {'genre': genre_name, 'track': items[0]['name'],
-                        'artist': items[0]['artists'][0]['name']}
-                self.speak_dialog('ListeningToGenre', data)
-                time.sleep(2)
-                self.spotify_play(dev['id'], uris=uris)
-            elif data_type == 'show':
-                (show, uri) = get_show_info(data)
-                self.speak_dialog('ListeningToPodcast', data={'show': show})
-                time.sleep(2)
-                self.spotify_play(dev['id'], context_uri=uri)
-            else:
-                self.log.error('wrong data_type')
-                raise ValueError("Invalid type")
+            dialog, dialog_data, uris, context_uri = self.play_plan(
+                data, data_type, genre_name)
         except Exception as e:
             self.log.error("Unable to obtain the name, artist, "
                            "and/or URI information while asked to play "
                            "something. " + str(e))
             raise
+        self.speak_then_play(dialog, dialog_data, dev, uris=uris,
+                             context_uri=context_uri)
+
+    def play_plan(self, data, data_type='track', genre_name=None):
+        """Get what to say and what to play for data.
+
+        Arguments are the same as for play().
+
+        Returns:
+            tuple (dialog, dialog data, uris, context uri)
+        """
+        if data_type == 'saved_tracks':
+            # Grab 200 random songs
+            # Spotify doesn't like it when we send thousands of songs
+            uris = self.saved_tracks.uris
+            uris = random.sample(uris, min(len(uris), 200))
+            return 'ListeningToSavedSongs', None, uris, None
+        elif data_type == 'track':
+            (song, artists, uri) = get_song_info(data)
+            return ('ListeningToSongBy',
+                    {'tracks': song, 'artist': artists[0]}, [uri], None)
+        elif data_type == 'artist':
+            (artist, uri) = get_artist_info(data)
+            return 'ListeningToArtist', {'artist': artist}, None, uri
+        elif data_type == 'album':
+            (album, artists, uri) = get_album_info(data)
+            return ('ListeningToAlbumBy',
+                    {'album': album, 'artist': artists[0]}, None, uri)
+        elif data_type == 'genre':
+            items = data['tracks']['items']
+            random.shuffle(items)
+            uris = []
+            for item in items:
+                uris.append(item['uri'])
+            data = {'genre': genre_name, 'track': items[0]['name'],
+                    'artist': items[0]['artists'][0]['name']}
+            return 'ListeningToGenre', data, uris, None
+        elif data_type == 'show':
+            (show, uri) = get_show_info(data)
+            return 'ListeningToPodcast', {'show': show}, None, uri
+        else:
+            self.log.error('wrong data_type')
+            raise ValueError("Invalid type")
+
+    @TRACER.traced(arguments=('dialog',))
+    def speak_then_play(self, dialog, data, dev, uris=None, context_uri=None):
+        """Speak dialog and start playback when it has been spoken.
+
+        The device is resolved first so the confirmation isn't spoken when
+        nothing can be played. The playback is started when Mycroft reports
+        the end of the speech, or after the speech_timeout setting (2
+        seconds by default) if it doesn't.
+
+        Arguments:
+            dialog (str): dialog to speak
+            data (dict): dialog data
+            dev (dict): device to play on, if None the default device is
+                        used
+            uris (list): track uris to play
+            context_uri (str): context to play
+        """
+        # Playing on the device transfers playback to it
+        dev = dev or self.resolve_device().device
+        if not dev:
+            raise NoSpotifyDevicesError
+        self.speech_done.clear()
+        self.speak_dialog(dialog, data)
+        timeout = self.settings.get('speech_timeout', SPEECH_TIMEOUT)
+        with TRACER.span('wait_for_speech') as span:
+            spoken = self.speech_done.wait(timeout)
+            span.set(spoken=spoken)
+        if not spoken:
+            self.log.debug('No end of speech within {}s'.format(timeout))
+        self.spotify_play(dev['id'], uris=uris, context_uri=context_uri)
+
+    def handle_audio_output_end(self, message):
+        self.speech_done.set()
 
     def search(self, query, search_type):
         """ Search for an album, playlist or artist.
@@ -1121,10 +1673,8 @@ class SpotifySkill(CommonPlaySkill):
         """ Intent handler for "search spotify for X". """
 
         try:
-            dev = self.get_default_device()
-            if not dev:
-                raise NoSpotifyDevicesError
-
+            # The device is resolved before the confirmation is spoken
+            dev = None
             utterance = message.data['utterance']
             if len(utterance.split(self.translate('ForAlbum'))) == 2:
                 query = utterance.split(self.translate('ForAlbum'))[1].strip()
@@ -1291,7 +1841,7 @@ class SpotifySkill(CommonPlaySkill):
         """ List available devices. """
         self.log.info(self.spotify)
         if self.spotify:
-            devices = [d['name'] for d in self.spotify.get_devices()]
+            devices = [d['name'] for d in self.devices]
             if len(devices) == 1:
                 self.speak(devices[0])
             elif len(devices) > 1:
@@ -1313,6 +1863,7 @@ class SpotifySkill(CommonPlaySkill):
             if dev:
                 self.log.info('Transfering playback to {}'.format(dev['name']))
                 self.spotify.transfer_playback(dev['id'])
+                self.device_registry.invalidate()
                 # If mycroft is allowed to control playback started elsewhere,
                 # update dev_id when playback is transferred between devices
                 if self.allow_master_control:
@@ -1358,19 +1909,46 @@ class SpotifySkill(CommonPlaySkill):
         else:
             return False
 
+    @property
+    def process(self):
+        """The librespot process, None if not running."""
+        return self.librespot.process
+
     def stop_librespot(self):
         """ Send Terminate signal to librespot if it's running. """
-        if self.process and self.process.poll() is None:
-            self.process.send_signal(signal.SIGTERM)
-            self.process.communicate()  # Communicate to remove zombie
+        self.librespot.stop()
+        # Make sure devices are fetched again
+        self.device_registry.invalidate()
+
+    def handle_librespot_crash(self, stats):
+        """Report a librespot crash, the supervisor restarts it.
+
+        Arguments:
+            stats (dict): LibrespotSupervisor.stats()
+        """
+        self.device_registry.invalidate()
+        self.bus.emit(Message('spotify.librespot.crashed', stats))
 
-        self.process = None
+    def handle_librespot_stats(self, message):
+        """Respond with the librespot crash and restart counters."""
+        self.bus.emit(message.response(self.librespot.stats()))
 
     def shutdown(self):
         """ Remove the monitor at shutdown. """
         self.cancel_scheduled_event('SpotifyLogin')
+        self.cancel_scheduled_event('SpotifyPrefetch')
+        self.cancel_scheduled_event('SpotifyCacheCompaction')
+        self.cancel_scheduled_event('SpotifyMetrics')
+        TRACER.disable()
         self.stop_monitor()
         self.stop_librespot()
+        if self.spotify:
+            self.spotify.stop_keep_warm()
+        if self._search_pool:
+            self._search_pool.shutdown(wait=False)
+            self._search_pool = None
+        if self.cache:
+            self.cache.close()
 
         # Do normal shutdown procedure
         super(SpotifySkill, self).shutdown()
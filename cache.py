@@ -0,0 +1,211 @@
+"""Persistent cache for Spotify data.
+
+Search responses, playlist and track metadata are stored in a SQLite
+database so they survive restarts of the skill and the device.
+"""
+import json
+import sqlite3
+import time
+from threading import Event, Lock
+
+from mycroft.util.log import LOG
+
+# Default max size of the stored values in bytes
+DEFAULT_MAX_SIZE = 32 * 1024 * 1024
+# Min number of removed entries for which the file is rewritten
+VACUUM_MIN_REMOVED = 100
+# Time in seconds an access waits for another connection holding the
+# database (a VACUUM) before failing
+BUSY_TIMEOUT = 0.1
+
+
+class PersistentCache:
+    """ SQLite backed key/value store with per entry expiry.
+
+    Values are stored as json in namespaces (for example 'search' or
+    'library'). When the total size of the stored values grows above
+    max_size compact() removes the least recently used entries. The
+    compaction can take seconds on a slow device and is left to the owner
+    to run, away from the user's requests.
+
+    The access times are kept in memory until the next compaction, a read
+    doesn't write to the database. While a compaction runs get() reports
+    a miss and put() drops the value instead of waiting for it.
+
+    Failures are logged and treated as cache misses, the cache should never
+    stop the skill from working.
+
+    Arguments:
+        path (str): path to the database file
+        max_size (int): max total size of stored values in bytes
+    """
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._lock = Lock()
+        self._accessed = {}  # Access times not yet written
+        self._compacting = Event()
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False,
+                                       isolation_level=None,
+                                       timeout=BUSY_TIMEOUT)
+            self._db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                             'namespace TEXT NOT NULL, '
+                             'key TEXT NOT NULL, '
+                             'value TEXT NOT NULL, '
+                             'size INTEGER NOT NULL, '
+                             'expires REAL NOT NULL, '
+                             'accessed REAL NOT NULL, '
+                             'PRIMARY KEY (namespace, key))')
+        except sqlite3.Error as e:
+            LOG.error('Could not open cache {} ({})'.format(path, repr(e)))
+            self._db = None
+
+    def get(self, namespace, key):
+        """ Get a stored value.
+
+        Arguments:
+            namespace (str): value namespace
+            key (str): value key
+
+        Returns:
+            The stored value or None if missing or expired.
+        """
+        if not self._db or self._compacting.is_set():
+            return None
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    'SELECT value, expires FROM entries '
+                    'WHERE namespace = ? AND key = ?',
+                    (namespace, key)).fetchone()
+                if row is None:
+                    return None
+                value, expires = row
+                if expires < now:
+                    self._db.execute('DELETE FROM entries '
+                                     'WHERE namespace = ? AND key = ?',
+                                     (namespace, key))
+                    return None
+                self._accessed[(namespace, key)] = now
+            return json.loads(value)
+        except (sqlite3.Error, ValueError) as e:
+            LOG.error('Cache read failed ({})'.format(repr(e)))
+            return None
+
+    def put(self, namespace, key, value, ttl):
+        """ Store a value.
+
+        Arguments:
+            namespace (str): value namespace
+            key (str): value key
+            value: json serializable value
+            ttl (float): time in seconds until the entry expires
+        """
+        if not self._db or self._compacting.is_set():
+            return
+        now = time.time()
+        try:
+            data = json.dumps(value)
+            with self._lock:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO entries '
+                    '(namespace, key, value, size, expires, accessed) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (namespace, key, data, len(data), now + ttl, now))
+                self._accessed.pop((namespace, key), None)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            LOG.error('Cache write failed ({})'.format(repr(e)))
+
+    def delete(self, namespace, key):
+        """ Remove a value. """
+        if not self._db:
+            return
+        try:
+            with self._lock:
+                self._db.execute('DELETE FROM entries '
+                                 'WHERE namespace = ? AND key = ?',
+                                 (namespace, key))
+        except sqlite3.Error as e:
+            LOG.error('Cache delete failed ({})'.format(repr(e)))
+
+    def size(self):
+        """ Total size of the stored values in bytes. """
+        if not self._db:
+            return 0
+        with self._lock:
+            return self._db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def compact(self):
+        """ Remove expired entries and shrink the cache to max_size.
+
+        The buffered access times are written first, then the least
+        recently used entries are removed until the stored values fit
+        within max_size. If much was removed the file is rewritten, see
+        _vacuum().
+        """
+        if not self._db:
+            return
+        self._compacting.set()
+        try:
+            with self._lock:
+                accessed = [(t, namespace, key) for (namespace, key), t
+                            in self._accessed.items()]
+                self._accessed = {}
+                self._db.execute('BEGIN')
+                try:
+                    self._db.executemany('UPDATE entries SET accessed = ? '
+                                         'WHERE namespace = ? AND key = ?',
+                                         accessed)
+                    removed = self._db.execute(
+                        'DELETE FROM entries WHERE expires < ?',
+                        (time.time(),)).rowcount
+                    size = self._db.execute(
+                        'SELECT COALESCE(SUM(size), 0) '
+                        'FROM entries').fetchone()[0]
+                    trimmed = size > self.max_size
+                    if trimmed:
+                        rows = self._db.execute(
+                            'SELECT namespace, key, size FROM entries '
+                            'ORDER BY accessed').fetchall()
+                        for namespace, key, entry_size in rows:
+                            if size <= self.max_size:
+                                break
+                            self._db.execute(
+                                'DELETE FROM entries '
+                                'WHERE namespace = ? AND key = ?',
+                                (namespace, key))
+                            size -= entry_size
+                            removed += 1
+                    self._db.execute('COMMIT')
+                except sqlite3.Error:
+                    self._db.execute('ROLLBACK')
+                    raise
+            # Only rewrite the file when a fair amount was removed
+            if trimmed or removed >= VACUUM_MIN_REMOVED:
+                self._vacuum()
+        except sqlite3.Error as e:
+            LOG.error('Cache compaction failed ({})'.format(repr(e)))
+        finally:
+            self._compacting.clear()
+
+    def _vacuum(self):
+        """ Rewrite the database file to release the free space.
+
+        Runs on a connection of its own without holding the lock, an
+        access racing with it fails after BUSY_TIMEOUT instead of waiting
+        for the whole rewrite.
+        """
+        db = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            db.execute('VACUUM')
+        finally:
+            db.close()
+
+    def close(self):
+        if self._db:
+            with self._lock:
+                self._db.close()
+                self._db = None
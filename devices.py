@@ -0,0 +1,131 @@
+"""Registry of the user's Spotify Connect devices."""
+import time
+from collections import namedtuple
+from threading import Lock, Thread
+
+from mycroft.util.log import LOG
+
+from .matching import Candidates
+from .ratelimit import BACKGROUND, request_lane
+
+# Time in seconds before the device list is refreshed
+DEVICE_REFRESH_INTERVAL = 60
+# Min confidence for a device name match
+DEVICE_NAME_CONFIDENCE = 0.5
+
+
+class DeviceChoice(namedtuple('DeviceChoice',
+                              ['device', 'device_type', 'remote'])):
+    """ Device chosen for playback.
+
+    Attributes:
+        device (dict): device description from Spotify, None if not found
+        device_type (DeviceType): how the device was chosen
+        remote (bool): True if the device isn't Mycroft's speaker
+    """
+    __slots__ = ()
+
+    @property
+    def needs_transfer(self):
+        """ True if playback must be transferred to control the device.
+
+        Starting playback on a device transfers playback to it.
+        """
+        return bool(self.device) and not self.device['is_active']
+
+
+class DeviceRegistry:
+    """ The user's Spotify Connect devices.
+
+    The device list is served from memory. When it's older than max_age a
+    refresh is started in the background and the current list is used
+    until it's done (stale-while-revalidate). While there are no devices
+    and after invalidate() get() waits for a new list, invalidate() is
+    called when the devices are known to have changed (playback
+    transferred, librespot restarted or a device not found).
+
+    The device names are kept prepared for fuzzy matching, see find().
+
+    Arguments:
+        max_age (float): time in seconds before the list is refreshed
+    """
+    def __init__(self, max_age=DEVICE_REFRESH_INTERVAL):
+        self.max_age = max_age
+        self.devices = []
+        # Devices by lower case name and the names prepared for matching
+        self.names = ({}, Candidates([]))
+        self.fetched = 0
+        self.valid = False
+        self._lock = Lock()
+        self._refreshing = False
+
+    def get(self, spotify):
+        """ Get the devices.
+
+        Arguments:
+            spotify (SpotifyConnect): connection used if a refresh is needed
+
+        Returns:
+            (list) device descriptions from Spotify
+        """
+        if not self.valid or not self.devices:
+            self.refresh(spotify)
+        elif time.monotonic() - self.fetched > self.max_age:
+            self.refresh_async(spotify)
+        return self.devices
+
+    def find(self, spotify, name):
+        """ Find a device by name.
+
+        Arguments:
+            spotify (SpotifyConnect): connection used if a refresh is needed
+            name (str): the device name (fuzzy matches)
+
+        Returns:
+            (dict) None or the matching device's description
+        """
+        if not self.get(spotify):
+            return None
+        by_name, candidates = self.names
+        index, confidence = candidates.match_one(name)
+        if index is not None and confidence > DEVICE_NAME_CONFIDENCE:
+            return by_name[candidates.titles[index]]
+        return None
+
+    def invalidate(self):
+        """ Make the next get() wait for a new device list. """
+        self.valid = False
+
+    def refresh_async(self, spotify):
+        """ Start a background refresh unless one is already running. """
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        Thread(target=self._refresh, args=(spotify,), daemon=True,
+               name='SpotifyDeviceRefresh').start()
+
+    def _refresh(self, spotify):
+        try:
+            with request_lane(BACKGROUND):
+                self.refresh(spotify)
+        except Exception as e:
+            LOG.error('Device refresh failed ({})'.format(repr(e)))
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def refresh(self, spotify):
+        """ Fetch the device list.
+
+        Arguments:
+            spotify (SpotifyConnect): connection to fetch the devices with
+        """
+        self.valid = True
+        self.fetched = time.monotonic()
+        self._set_devices(spotify.get_devices() or [])
+
+    def _set_devices(self, devices):
+        by_name = {d['name'].lower(): d for d in devices}
+        self.names = (by_name, Candidates(by_name))
+        self.devices = devices
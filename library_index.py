@@ -0,0 +1,196 @@
+"""Local search index over the user's library.
+
+Most requests are for things already in the user's library, the index
+allows these to be found without searching Spotify. Names are looked up
+through trigram postings and the best candidates are scored with the same
+fuzzy matching as the search results from Spotify.
+"""
+import heapq
+from array import array
+from collections import Counter, defaultdict
+from threading import Lock
+
+from .matching import best_confidence
+
+# Kinds of items in the index, in the priority order of a generic query
+LIBRARY_KINDS = ('playlist', 'artist', 'track', 'album')
+# Number of candidates from the trigram lookup scored for each query
+MAX_CANDIDATES = 10
+
+
+def trigrams(text):
+    """Set of trigrams of text, padded to give weight to the word start."""
+    padded = '  {} '.format(text)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Trigram index of names.
+
+    Arguments:
+        names (list): names to index
+        items (list): item for each name, returned when the name matches
+    """
+    def __init__(self, names, items):
+        self.names = names
+        self.items = items
+        self.sizes = array('H')  # Number of trigrams for each name
+        postings = defaultdict(list)
+        for i, name in enumerate(names):
+            grams = trigrams(name.lower())
+            self.sizes.append(min(len(grams), 0xffff))
+            for gram in grams:
+                postings[gram].append(i)
+        self.postings = {gram: array('I', p) for gram, p in postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def candidates(self, query, limit=MAX_CANDIDATES):
+        """Names sharing the most trigrams with query.
+
+        Arguments:
+            query (str): lower case query
+            limit (int): max number of candidates
+
+        Returns:
+            list of name indices, best first
+        """
+        grams = trigrams(query)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        # Rank by the Dice coefficient of the trigram sets
+        return heapq.nlargest(
+            limit, shared,
+            key=lambda i: shared[i] / (len(grams) + self.sizes[i]))
+
+    def search(self, query):
+        """Find the best matching name.
+
+        Arguments:
+            query (str): lower case query
+
+        Returns:
+            tuple (confidence, item), (0.0, None) if nothing matched
+        """
+        best = (0.0, None)
+        for i in self.candidates(query):
+            confidence = best_confidence(self.names[i], query)
+            if confidence > best[0]:
+                best = (confidence, self.items[i])
+        return best
+
+
+class LibraryIndex:
+    """Search index over saved tracks, saved albums and playlists.
+
+    Artists are taken from the saved tracks and albums. The user's top
+    artists and tracks are included if available. The index is rebuilt by
+    update() when any of the sources have changed.
+    """
+    def __init__(self):
+        self.indices = {}
+        self.versions = None
+        self._lock = Lock()
+
+    def __len__(self):
+        return sum(len(index) for index in self.indices.values())
+
+    def update(self, saved_tracks, saved_albums, playlists, top_items=None):
+        """Rebuild the index if the library has changed.
+
+        Arguments:
+            saved_tracks (SavedTracks): the user's saved tracks
+            saved_albums (SavedAlbums): the user's saved albums
+            playlists (UserPlaylists): the user's playlists
+            top_items (Prefetcher): the user's top artists and tracks
+        """
+        versions = (saved_tracks.version, saved_albums.version,
+                    playlists.version, top_items and top_items.version)
+        with self._lock:
+            if versions == self.versions:
+                return
+            tracks = {}
+            artists = {}
+            albums = {}
+            for _, uri, name, artist, popularity, artist_uri, album, \
+                    album_uri in saved_tracks.columns.rows():
+                tracks.setdefault(uri, (uri, name, artist, artist_uri))
+                artists.setdefault(artist_uri, (artist_uri, artist))
+                albums.setdefault(album_uri,
+                                  (album_uri, album, artist, artist_uri))
+            for uri, name, artist, artist_uri in saved_albums.albums:
+                artists.setdefault(artist_uri, (artist_uri, artist))
+                albums.setdefault(uri, (uri, name, artist, artist_uri))
+            if top_items:
+                for uri, name in top_items.artists:
+                    artists.setdefault(uri, (uri, name))
+                for track in top_items.tracks:
+                    tracks.setdefault(track[0], track)
+                    artists.setdefault(track[3], (track[3], track[2]))
+            artists.pop(None, None)
+            albums.pop(None, None)
+
+            def index(items):
+                return TrigramIndex([item[1] for item in items], items)
+
+            playlist_items = list(playlists.by_id.values())
+            self.indices = {
+                'playlist': TrigramIndex([p['name'] for p in playlist_items],
+                                         playlist_items),
+                'artist': index(list(artists.values())),
+                'track': index(list(tracks.values())),
+                'album': index(list(albums.values()))
+            }
+            self.versions = versions
+
+    def search(self, query, kinds=LIBRARY_KINDS):
+        """Find the best match for the query.
+
+        On equal confidence the kind listed first in kinds is preferred.
+
+        Arguments:
+            query (str): lower case query
+            kinds (tuple): kinds of items to search
+
+        Returns:
+            tuple (confidence, kind, item), (0.0, None, None) if nothing
+            matched
+        """
+        indices = self.indices
+        best = (0.0, None, None)
+        for kind in kinds:
+            if kind in indices:
+                confidence, item = indices[kind].search(query)
+                if confidence > best[0]:
+                    best = (confidence, kind, item)
+        return best
+
+
+def library_result(kind, item):
+    """Create query result data for an item in the index.
+
+    The data has the same structure as for the results from the Spotify
+    search so it can be played in the same way.
+
+    Arguments:
+        kind (str): 'playlist', 'artist', 'track' or 'album'
+        item: the matching item from LibraryIndex.search()
+
+    Returns:
+        (dict) query result data
+    """
+    if kind == 'playlist':
+        return {'data': item, 'name': item['name'].lower(),
+                'type': 'playlist'}
+    elif kind == 'artist':
+        uri, name = item
+        return {'data': {'artists': {'items': [{'name': name, 'uri': uri}]}},
+                'name': None, 'type': 'artist'}
+    else:
+        uri, name, artist, artist_uri = item
+        result = {'name': name, 'uri': uri,
+                  'artists': [{'name': artist, 'uri': artist_uri}]}
+        return {'data': {kind + 's': {'items': [result]}},
+                'name': None, 'type': kind}
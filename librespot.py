@@ -0,0 +1,171 @@
+"""Supervision of the librespot process."""
+import os
+import signal
+import time
+from shutil import which
+from subprocess import DEVNULL, Popen, call
+from threading import Lock, Thread, Timer
+
+from mycroft.util.log import LOG
+
+# A librespot started by the skill and exiting within this time in seconds
+# failed to start (for example due to a wrong password) and isn't restarted.
+# Restarted processes are always restarted again, with backoff.
+MIN_UPTIME = 10
+# A librespot running for this time in seconds is considered stable and
+# the restart backoff is reset
+STABLE_UPTIME = 5 * 60
+# Delay in seconds before the first restart, doubled for each consecutive
+# crash
+RESTART_DELAY = 1
+MAX_RESTART_DELAY = 5 * 60
+
+
+class LibrespotSupervisor:
+    """ Start librespot and restart it when it crashes.
+
+    A watcher thread waits for the process to exit. Unless it was stopped
+    or the initial launch exited during start-up it's restarted after a
+    delay, doubling for each crash until it has run for STABLE_UPTIME.
+
+    The CPU and IO priority of librespot can be raised so the audio
+    decoding isn't starved by other work (negative niceness requires the
+    CAP_SYS_NICE capability).
+
+    Arguments:
+        restart (callable): called to start librespot again
+        on_crash (callable): called with stats() when librespot crashed
+        nice (int): niceness of librespot, None to keep the default
+        ionice_class (int): IO scheduling class, 1 (realtime), 2 (best
+                            effort) or 3 (idle), None to keep the default
+        ionice_level (int): IO priority within the class, 0 (highest) to 7
+    """
+    def __init__(self, restart, on_crash=None, nice=None, ionice_class=None,
+                 ionice_level=None):
+        self.restart = restart
+        self.on_crash = on_crash
+        self.nice = nice
+        self.ionice_class = ionice_class
+        self.ionice_level = ionice_level
+        self.process = None
+        self.started = 0
+        self.starts = 0
+        self.crashes = 0
+        self.restarts = 0
+        self.consecutive_crashes = 0
+        self._restart_timer = None
+        self._restarting = False  # start() called by a restart
+        self._lock = Lock()
+
+    def start(self, args, output=DEVNULL):
+        """ Start librespot.
+
+        Any pending restart is cancelled. Unless called for a restart the
+        backoff is reset.
+
+        Arguments:
+            args (list): librespot command line
+            output: stdout and stderr for librespot
+
+        Returns:
+            (Popen) the started process
+        """
+        with self._lock:
+            self._cancel_restart()
+            initial = not self._restarting
+            if initial:
+                self.consecutive_crashes = 0
+            process = Popen(args, stdout=output, stderr=output)
+            self.process = process
+            self.started = time.monotonic()
+            self.starts += 1
+        self._set_priority(process.pid)
+        Thread(target=self._watch, args=(process, self.started, initial),
+               daemon=True, name='LibrespotWatcher').start()
+        return process
+
+    def stop(self):
+        """ Terminate librespot without restarting it. """
+        with self._lock:
+            self._cancel_restart()
+            process = self.process
+            self.process = None
+        if process and process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+            process.communicate()  # Communicate to remove zombie
+
+    def stats(self):
+        """ Process counters as a dict. """
+        with self._lock:
+            running = self.process is not None
+            return {
+                'running': running,
+                'uptime': time.monotonic() - self.started if running else 0,
+                'starts': self.starts,
+                'crashes': self.crashes,
+                'restarts': self.restarts,
+                'consecutive_crashes': self.consecutive_crashes
+            }
+
+    def _cancel_restart(self):
+        if self._restart_timer:
+            self._restart_timer.cancel()
+            self._restart_timer = None
+
+    def _set_priority(self, pid):
+        if self.nice is not None:
+            try:
+                os.setpriority(os.PRIO_PROCESS, pid, self.nice)
+            except OSError as e:
+                LOG.warning('Could not set librespot niceness '
+                            '({})'.format(repr(e)))
+        if self.ionice_class is not None:
+            command = ['ionice', '-c', str(self.ionice_class)]
+            if self.ionice_level is not None and self.ionice_class != 3:
+                command += ['-n', str(self.ionice_level)]
+            if not which('ionice') or \
+                    call(command + ['-p', str(pid)], stdout=DEVNULL,
+                         stderr=DEVNULL) != 0:
+                LOG.warning('Could not set librespot IO priority')
+
+    def _watch(self, process, started, initial):
+        returncode = process.wait()
+        with self._lock:
+            if process is not self.process:
+                return  # Stopped or replaced
+            self.process = None
+            self.crashes += 1
+            uptime = time.monotonic() - started
+            if initial and uptime < MIN_UPTIME:
+                LOG.error('librespot exited during start-up '
+                          '({})'.format(returncode))
+                restart = False
+            else:
+                if uptime >= STABLE_UPTIME:
+                    self.consecutive_crashes = 0
+                delay = min(RESTART_DELAY * 2 ** self.consecutive_crashes,
+                            MAX_RESTART_DELAY)
+                self.consecutive_crashes += 1
+                LOG.warning('librespot exited ({}), restarting in '
+                            '{}s'.format(returncode, delay))
+                self._restart_timer = Timer(delay, self._restart)
+                self._restart_timer.daemon = True
+                self._restart_timer.start()
+                restart = True
+        if self.on_crash:
+            stats = self.stats()
+            stats['restarting'] = restart
+            self.on_crash(stats)
+
+    def _restart(self):
+        with self._lock:
+            self._restart_timer = None
+            self._restarting = True
+            self.restarts += 1
+        try:
+            self.restart()
+        except Exception as e:
+            LOG.error('librespot restart failed ({})'.format(repr(e)))
+        finally:
+            with self._lock:
+                self._restarting = False
@@ -0,0 +1,175 @@
+"""Fuzzy matching of Spotify titles against user queries.
+
+The scores are the same as from mycroft.util.parse.fuzzy_match() (the
+difflib.SequenceMatcher ratio). When many candidates are scored against a
+query the Candidates class keeps the normalized keys precomputed and skips
+the full comparison for candidates that can't affect the result.
+"""
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+
+
+def fuzzy_match(x, against):
+    """Perform a 'fuzzy' comparison between two strings.
+
+    Same as mycroft.util.parse.fuzzy_match().
+
+    Returns:
+        (float) match percentage, 1.0 for a perfect match
+    """
+    return SequenceMatcher(None, x, against).ratio()
+
+
+def strip_title(title):
+    """Remove trailing info like "(Remastered 2016)" or "- Live" from title.
+
+    Arguments:
+        title (str): lower case title
+
+    Returns:
+        (str) stripped title
+    """
+    return re.sub(r'(\(.+\)|-.+)$', '', title).strip()
+
+
+def best_confidence(title, query):
+    """Find best match for a title against a query.
+
+    Some titles include ( Remastered 2016 ) and similar info. This method
+    will test the raw title and a version that has been parsed to remove
+    such information.
+
+    Arguments:
+        title: title name from spotify search
+        query: query from user
+
+    Returns:
+        (float) best condidence
+    """
+    best = title.lower()
+    best_stripped = strip_title(best)
+    return max(fuzzy_match(best, query),
+               fuzzy_match(best_stripped, query))
+
+
+def max_ratio(key, key_counts, query, query_counts):
+    """Upper bound of fuzzy_match() between key and query.
+
+    The number of matching characters can't be larger than the shorter
+    string or the number of characters the strings have in common.
+    """
+    length = len(key) + len(query)
+    if not length:
+        return 1.0
+    matches = min(len(key), len(query))
+    if matches and len(key_counts) <= len(query_counts):
+        matches = min(matches, sum(min(n, query_counts[c])
+                                   for c, n in key_counts.items()))
+    elif matches:
+        matches = min(matches, sum(min(n, key_counts[c])
+                                   for c, n in query_counts.items()))
+    return 2.0 * matches / length
+
+
+class Candidates:
+    """A batch of titles prepared for fuzzy matching against queries.
+
+    The lower case (and optionally stripped) keys and their character
+    counts are computed once so the same titles can be matched against
+    any number of queries.
+
+    Arguments:
+        titles (list): titles to match against
+        strip (bool): also prepare keys with trailing info removed, needed
+                      for best_confidences()
+    """
+    def __init__(self, titles, strip=False):
+        self.titles = list(titles)
+        self.keys = [self._prepare(title.lower()) for title in self.titles]
+        if strip:
+            # None when stripping doesn't change the key
+            self.stripped = [self._prepare(strip_title(key), key)
+                             for key, _ in self.keys]
+        else:
+            self.stripped = None
+
+    @staticmethod
+    def _prepare(key, unless=None):
+        return (key, Counter(key)) if key != unless else None
+
+    def __len__(self):
+        return len(self.titles)
+
+    def _bounds(self, query, stripped=False):
+        """Candidate indices with their max_ratio(), highest bound first."""
+        query_counts = Counter(query)
+        bounds = []
+        for i, (key, key_counts) in enumerate(self.keys):
+            bound = max_ratio(key, key_counts, query, query_counts)
+            if stripped and self.stripped[i]:
+                bound = max(bound, max_ratio(*self.stripped[i], query,
+                                             query_counts))
+            bounds.append((bound, i))
+        bounds.sort(key=lambda b: (-b[0], b[1]))
+        return bounds
+
+    def best_confidences(self, query, margin=None):
+        """best_confidence() of each title against query.
+
+        Arguments:
+            query (str): query from user
+            margin (float): only titles scoring more than the best score
+                            minus margin are needed, titles which can't
+                            reach that get None instead of a score.
+                            If None all titles are scored.
+
+        Returns:
+            list of scores (or None), one for each title
+        """
+        # The analysis of the query is reused for all titles
+        matcher = SequenceMatcher(None, '', query)
+
+        def score(i):
+            matcher.set_seq1(self.keys[i][0])
+            confidence = matcher.ratio()
+            if self.stripped and self.stripped[i]:
+                matcher.set_seq1(self.stripped[i][0])
+                confidence = max(confidence, matcher.ratio())
+            return confidence
+
+        if margin is None:
+            return [score(i) for i in range(len(self.keys))]
+
+        scores = [None] * len(self.keys)
+        best = 0.0
+        # Score the most promising titles first, when a title's bound is
+        # too low so are the bounds of the remaining titles.
+        for bound, i in self._bounds(query, stripped=bool(self.stripped)):
+            if bound <= best - margin:
+                break
+            scores[i] = score(i)
+            best = max(best, scores[i])
+        return scores
+
+    def match_one(self, query):
+        """Find the best matching title.
+
+        Same result as mycroft.util.parse.match_one(query, keys) where keys
+        are the lower case titles; on equal score the first title wins.
+
+        Arguments:
+            query (str): query from user
+
+        Returns:
+            tuple (index, score), (None, 0.0) if there are no titles
+        """
+        best = (None, 0.0)
+        for bound, i in self._bounds(query):
+            if best[0] is not None and bound < best[1]:
+                break
+            score = fuzzy_match(query, self.keys[i][0])
+            if best[0] is None or score > best[1] or \
+                    (score == best[1] and i < best[0]):
+                best = (i, score)
+        return best
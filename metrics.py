@@ -0,0 +1,229 @@
+"""Metrics of the Spotify Web API requests.
+
+Every response is counted per endpoint, with its status code, the number
+of bytes received, the latency and the number of retries. The endpoints
+are named by method and path with the ids replaced, for example
+'GET playlists/{id}/tracks'.
+
+The metrics can be exported in the Prometheus text format, for the node
+exporter's textfile collector.
+"""
+import os
+import time
+from collections import Counter
+from threading import Lock
+from urllib.parse import urlparse
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Path segments following these are ids
+ID_PARENTS = ('albums', 'artists', 'audiobooks', 'categories', 'episodes',
+              'playlists', 'shows', 'tracks', 'users')
+# Status recorded for requests that got no response
+NO_RESPONSE = 0
+# Methods of requests that aren't API calls, like the keep warm requests
+NON_API_METHODS = ('HEAD', 'OPTIONS')
+
+
+def endpoint(method, url):
+    """ Endpoint name of a request.
+
+    Arguments:
+        method (str): HTTP method
+        url (str): request url
+
+    Returns:
+        (str) method and path without the API prefix and ids
+    """
+    path = urlparse(url).path
+    path = path.split('/v1/', 1)[-1].strip('/')
+    parts = path.split('/')
+    if parts[0] != 'me':
+        for i in range(1, len(parts)):
+            if parts[i - 1] in ID_PARENTS:
+                parts[i] = '{id}'
+    return '{} {}'.format(method, '/'.join(parts))
+
+
+class EndpointMetrics:
+    """ Counters of one endpoint. """
+    def __init__(self, buckets):
+        self.requests = 0
+        self.statuses = Counter()
+        self.retries = 0
+        self.bytes = 0
+        self.latency = 0.0  # Sum of the latencies
+        self.buckets = [0 for _ in buckets] + [0]  # Last one is +Inf
+
+    def as_dict(self, buckets):
+        return {
+            'requests': self.requests,
+            'statuses': {str(s): n for s, n in sorted(self.statuses.items())},
+            'retries': self.retries,
+            'bytes': self.bytes,
+            'latency': self.latency,
+            'latency_buckets': dict(zip([str(b) for b in buckets] + ['+Inf'],
+                                        self.buckets))
+        }
+
+
+class APIMetrics:
+    """ Metrics of the API requests by endpoint.
+
+    response_hook() records the responses of a requests session, retries
+    made by the session (5xx responses, connection errors) are taken from
+    the response. Requests retried after a rate limit and requests without
+    a response are recorded by SpotifyConnect through record_retry() and
+    record_failure().
+
+    Arguments:
+        buckets (tuple): upper bounds of the latency histogram buckets
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.endpoints = {}
+        self.started = time.time()
+        self._lock = Lock()
+
+    def _endpoint(self, method, url):
+        name = endpoint(method, url)
+        metrics = self.endpoints.get(name)
+        if metrics is None:
+            metrics = self.endpoints[name] = EndpointMetrics(self.buckets)
+        return metrics
+
+    def record(self, method, url, status, latency, size, retries=0):
+        """ Record a response.
+
+        Arguments:
+            method (str): HTTP method
+            url (str): request url
+            status (int): response status code
+            latency (float): time in seconds until the response
+            size (int): number of bytes received
+            retries (int): number of times the request was retried
+        """
+        with self._lock:
+            metrics = self._endpoint(method, url)
+            metrics.requests += 1
+            metrics.statuses[status] += 1
+            metrics.retries += retries
+            metrics.bytes += size
+            metrics.latency += latency
+            for i, bound in enumerate(self.buckets):
+                if latency <= bound:
+                    metrics.buckets[i] += 1
+                    break
+            else:
+                metrics.buckets[-1] += 1
+
+    def record_retry(self, method, url):
+        """ Record a request retried after a rate limit. """
+        with self._lock:
+            self._endpoint(method, url).retries += 1
+
+    def record_failure(self, method, url, latency):
+        """ Record a request that got no response. """
+        self.record(method, url, NO_RESPONSE, latency, 0)
+
+    def response_hook(self, response, *args, **kwargs):
+        """ requests response hook recording the API responses.
+
+        Other requests on the session, like the keep warm HEAD requests,
+        aren't recorded.
+        """
+        if response.request.method in NON_API_METHODS:
+            return
+        history = getattr(getattr(response.raw, 'retries', None),
+                          'history', None)
+        self.record(response.request.method, response.url,
+                    response.status_code, response.elapsed.total_seconds(),
+                    len(response.content or b''),
+                    len(history) if history else 0)
+
+    def snapshot(self):
+        """ The metrics as a dict, by endpoint name. """
+        with self._lock:
+            return {
+                'since': self.started,
+                'endpoints': {name: metrics.as_dict(self.buckets)
+                              for name, metrics
+                              in sorted(self.endpoints.items())}
+            }
+
+    def prometheus(self, prefix='spotify_api'):
+        """ The metrics in the Prometheus text format. """
+        lines = []
+
+        def add(name, kind, help_text, samples):
+            name = '{}_{}'.format(prefix, name)
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for suffix, labels, value in samples:
+                lines.append('{}{}{{{}}} {}'.format(
+                    name, suffix, ','.join('{}="{}"'.format(k, v)
+                                           for k, v in labels), value))
+
+        with self._lock:
+            items = sorted(((name.split(' ', 1), metrics) for name, metrics
+                            in self.endpoints.items()), key=lambda i: i[0])
+            add('requests_total', 'counter', 'Responses by status code.',
+                [('', [('method', m), ('endpoint', e), ('status', status)],
+                  count)
+                 for (m, e), metrics in items
+                 for status, count in sorted(metrics.statuses.items())])
+            add('retries_total', 'counter', 'Retried requests.',
+                [('', [('method', m), ('endpoint', e)], metrics.retries)
+                 for (m, e), metrics in items])
+            add('received_bytes_total', 'counter', 'Bytes received.',
+                [('', [('method', m), ('endpoint', e)], metrics.bytes)
+                 for (m, e), metrics in items])
+            samples = []
+            for (m, e), metrics in items:
+                labels = [('method', m), ('endpoint', e)]
+                count = 0
+                for bound, n in zip(self.buckets + ('+Inf',),
+                                    metrics.buckets):
+                    count += n
+                    samples.append(('_bucket', labels + [('le', bound)],
+                                    count))
+                samples.append(('_sum', labels, metrics.latency))
+                samples.append(('_count', labels, count))
+            add('request_duration_seconds', 'histogram',
+                'Time until the response.', samples)
+        return '\n'.join(lines) + '\n'
+
+
+def prometheus_stats(prefix, stats):
+    """ Gauges in the Prometheus text format for a stats() dict.
+
+    The values of nested dicts (like the lanes in RequestScheduler.stats())
+    are labelled with their key, the label name is the dict's name without
+    the trailing s, for example spotify_scheduler_waiting{lane="query"}.
+
+    Arguments:
+        prefix (str): metric name prefix, for example 'spotify_scheduler'
+        stats (dict): numbers, booleans and nested dicts of those
+    """
+    lines = []
+    for name, value in stats.items():
+        metric = '{}_{}'.format(prefix, name)
+        if isinstance(value, dict):
+            label = name[:-1] if name.endswith('s') else name
+            for key, values in value.items():
+                for field, number in values.items():
+                    lines.append('{}_{}{{{}="{}"}} {}'.format(
+                        prefix, field, label, key, float(number)))
+        elif isinstance(value, (bool, int, float)):
+            lines.append('{} {}'.format(metric, float(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, text):
+    """ Replace the file at path with text, atomically so the collector
+    never reads a partial file.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
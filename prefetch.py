@@ -0,0 +1,150 @@
+"""Prefetching of data for likely requests.
+
+The user's top artists and tracks are the most likely things to be asked
+for. They're added to the local library index and searched in advance so
+the search results are cached, within an hourly request budget.
+"""
+import time
+from sys import intern
+from itertools import chain, zip_longest
+from threading import Lock
+
+from mycroft.util.log import LOG
+
+from .library import SNAPSHOT_TTL, intern_or_none
+from .ratelimit import BACKGROUND, request_lane
+
+# Max number of requests per hour
+DEFAULT_BUDGET = 60
+# Number of top artists and tracks fetched
+TOP_ITEMS = 50
+# Time in seconds between updates of the top artists and tracks
+TOP_REFRESH_INTERVAL = 24 * 60 * 60
+# Time in seconds before a name is searched again, the search results are
+# kept this long in the persistent cache
+SEARCH_INTERVAL = 24 * 60 * 60
+
+
+class Prefetcher:
+    """ The user's top artists and tracks, prefetched within a budget.
+
+    Arguments:
+        cache (PersistentCache): cache to store the top items in
+        budget (int): max number of requests per hour
+    """
+    def __init__(self, cache=None, budget=DEFAULT_BUDGET):
+        self.cache = cache
+        self.budget = budget
+        self.artists = []  # (uri, name) tuples, most listened first
+        self.tracks = []  # (uri, name, artist, artist_uri) tuples
+        self.fetched = 0
+        self.version = 0
+        self.searched = {}  # Time each name was searched
+        self.requests = 0  # Requests made during the current hour
+        self._hour = 0
+        self._lock = Lock()
+
+    def load(self):
+        """ Restore the top items from the persistent cache. """
+        stored = self.cache.get('library', 'top_items') if self.cache \
+            else None
+        if stored:
+            self.artists = [tuple(a) for a in stored['artists']]
+            self.tracks = [(uri, name, intern(artist),
+                            intern_or_none(artist_uri))
+                           for uri, name, artist, artist_uri
+                           in stored['tracks']]
+            self.fetched = stored['fetched']
+            self.searched = stored['searched']
+            self.version += 1
+
+    def store(self):
+        """ Store the top items in the persistent cache. """
+        if self.cache:
+            self.cache.put('library', 'top_items',
+                           {'artists': self.artists, 'tracks': self.tracks,
+                            'fetched': self.fetched,
+                            'searched': self.searched},
+                           SNAPSHOT_TTL)
+
+    def take(self, requests=1):
+        """ Use requests from the budget.
+
+        Returns:
+            True if the requests fit within the budget for this hour
+        """
+        with self._lock:
+            hour = int(time.time() // 3600)
+            if hour != self._hour:
+                self._hour = hour
+                self.requests = 0
+            if self.requests + requests > self.budget:
+                return False
+            self.requests += requests
+            return True
+
+    def run(self, spotify, search):
+        """ Prefetch as much as the budget allows.
+
+        The top items are updated daily, then the names not searched
+        during the last SEARCH_INTERVAL are searched, alternating between
+        artists and tracks in order of the user's preference.
+
+        Arguments:
+            spotify (SpotifyConnect): connection to fetch the top items with
+            search (callable): searches a name like a user query would
+
+        Returns:
+            (bool) True if the top items changed
+        """
+        changed = False
+        fetched = False
+        now = time.time()
+        with request_lane(BACKGROUND):
+            if now - self.fetched > TOP_REFRESH_INTERVAL and self.take(2):
+                changed = self.fetch_top_items(spotify)
+                fetched = True
+            names = [item[1] for item in
+                     chain(*zip_longest(self.artists, self.tracks))
+                     if item]
+            for name in names:
+                if now - self.searched.get(name, 0) <= SEARCH_INTERVAL:
+                    continue
+                if not self.take():
+                    break
+                search(name.lower())
+                self.searched[name] = now
+                fetched = True
+        if fetched:
+            # Forget names no longer in the top items
+            self.searched = {name: t for name, t in self.searched.items()
+                             if name in names}
+            self.store()
+        return changed
+
+    def fetch_top_items(self, spotify):
+        """ Fetch the user's top artists and tracks.
+
+        Arguments:
+            spotify (SpotifyConnect): connection to fetch the top items with
+
+        Returns:
+            (bool) True if the top items changed
+        """
+        artists = [(a['uri'], a['name']) for a in
+                   spotify.current_user_top_artists(limit=TOP_ITEMS)['items']]
+        tracks = []
+        for t in spotify.current_user_top_tracks(limit=TOP_ITEMS)['items']:
+            artist = (t.get('artists') or [{}])[0]
+            tracks.append((t['uri'], t['name'],
+                           intern(artist.get('name') or ''),
+                           intern_or_none(artist.get('uri'))))
+        self.fetched = time.time()
+        if artists == self.artists and tracks == self.tracks:
+            return False
+        self.artists = artists
+        self.tracks = tracks
+        self.version += 1
+        LOG.info('Updated {} top artists and {} top tracks'.format(
+            len(artists), len(tracks)))
+        return True
@@ -0,0 +1,96 @@
+"""Classification of play queries with the locale's patterns.
+
+specific_query() checks a phrase against the locale's saved_songs,
+playlist, album, artist, song and podcast patterns, in that order. The
+patterns are compiled into one regex with a named alternative per kind so
+a phrase is classified in a single scan. Alternatives are tried from left
+to right, the first kind matching wins just like when the patterns are
+tried one at a time.
+"""
+import re
+
+# Kinds of specific queries, in order of precedence
+QUERY_KINDS = ('saved_songs', 'playlist', 'album', 'artist', 'song',
+               'podcast')
+
+# Named group definitions and references, (?P<name> and (?P=name)
+_GROUP_NAME = re.compile(r'\(\?P([<=])(\w+)')
+
+
+def prefix_groups(pattern, prefix):
+    """ Prefix the names of the named groups in pattern.
+
+    Makes the group names unique when patterns are combined.
+    """
+    return _GROUP_NAME.sub(
+        lambda m: '(?P{}{}{}'.format(m.group(1), prefix, m.group(2)),
+        pattern)
+
+
+class QueryPatterns:
+    """ The patterns of the specific query kinds compiled into one regex.
+
+    Kinds without a pattern (the locale has no regex file for it) or with
+    an invalid one are never matched, the compile errors are kept in the
+    errors attribute.
+
+    Arguments:
+        patterns (dict): pattern by kind
+        kinds (tuple): kinds in order of precedence
+        flags (int): re flags of the patterns
+    """
+    def __init__(self, patterns, kinds=QUERY_KINDS, flags=re.IGNORECASE):
+        self.flags = flags
+        self.kinds = []
+        self.patterns = {}
+        self.errors = {}
+        for kind in kinds:
+            pattern = patterns.get(kind)
+            if not pattern:
+                continue
+            try:
+                re.compile(pattern, flags)
+            except re.error as e:
+                self.errors[kind] = e
+                continue
+            self.kinds.append(kind)
+            self.patterns[kind] = pattern
+        # Combined regex and the group names of each kind by skipped kinds
+        self._regexes = {}
+
+    def _compile(self, skip):
+        alternatives = ['(?P<{}>{})'.format(
+            kind, prefix_groups(self.patterns[kind], kind + '__'))
+            for kind in self.kinds if kind not in skip]
+        # (?!) never matches
+        regex = re.compile('|'.join(alternatives) or '(?!)', self.flags)
+        groups = {kind: [(name[len(kind) + 2:], name)
+                         for name in regex.groupindex
+                         if name.startswith(kind + '__')]
+                  for kind in self.kinds}
+        self._regexes[skip] = regex, groups
+        return regex, groups
+
+    def regex(self, skip=()):
+        """ The combined regex of the kinds not in skip. """
+        skip = tuple(skip)
+        return (self._regexes.get(skip) or self._compile(skip))[0]
+
+    def match(self, phrase, skip=()):
+        """ Classify a phrase.
+
+        Arguments:
+            phrase (str): the query
+            skip (tuple): kinds not to match
+
+        Returns:
+            tuple (kind, named groups of the kind's pattern as a dict) or
+            (None, None) if no kind matches
+        """
+        regex, groups = self._regexes.get(skip) or self._compile(skip)
+        match = regex.match(phrase)
+        if not match:
+            return None, None
+        # The kind's group encloses all others so it's closed last
+        kind = match.lastgroup
+        return kind, {name: match.group(group) for name, group in groups[kind]}
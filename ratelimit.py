@@ -0,0 +1,161 @@
+"""Client side rate limiting of the Spotify API requests.
+
+All requests share one token bucket. Requests are sent in one of three
+priority lanes, when the bucket is empty the waiting requests of a higher
+priority lane go first:
+
+    PLAYBACK    playback control (play, pause, next track...)
+    QUERY       searches and other lookups answering the user
+    BACKGROUND  library sync, playlist refresh, status polling...
+
+A request's lane is taken from the request_lane() context of the calling
+thread, if there is none the lane is chosen from the endpoint.
+"""
+import time
+from contextlib import contextmanager
+from threading import Condition, local
+
+PLAYBACK = 0
+QUERY = 1
+BACKGROUND = 2
+LANES = (PLAYBACK, QUERY, BACKGROUND)
+LANE_NAMES = ('playback', 'query', 'background')
+
+# Sustained number of requests per second
+DEFAULT_RATE = 10
+# Number of requests that can be sent at once after an idle period
+DEFAULT_BURST = 20
+# Max time in seconds a playback or query request waits for a rate limit
+# to expire, if longer it's sent right away and fails rather than leaving
+# the user waiting.
+MAX_INTERACTIVE_WAIT = 10
+
+_context = local()
+
+
+@contextmanager
+def request_lane(lane):
+    """ Send the requests made by this thread within the block in lane.
+
+    Arguments:
+        lane (int): PLAYBACK, QUERY or BACKGROUND
+    """
+    previous = getattr(_context, 'lane', None)
+    _context.lane = lane
+    try:
+        yield
+    finally:
+        _context.lane = previous
+
+
+def current_lane():
+    """ Lane set by request_lane() for this thread, None if not set. """
+    return getattr(_context, 'lane', None)
+
+
+def default_lane(method, url):
+    """ Lane for a request made outside a request_lane() block.
+
+    Arguments:
+        method (str): HTTP method
+        url (str): endpoint url
+    """
+    if method != 'GET' and 'me/player' in url:
+        return PLAYBACK
+    return QUERY
+
+
+class RequestScheduler:
+    """ Token bucket shared by the priority lanes.
+
+    A request waits until a token is available, no request of a higher
+    priority lane is waiting and any rate limit reported by Spotify
+    (rate_limited()) has expired.
+
+    Arguments:
+        rate (float): tokens added per second
+        burst (int): max number of tokens
+    """
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.blocked_until = 0
+        self._refilled = time.monotonic()
+        self._cond = Condition()
+        self.waiting = [0 for _ in LANES]  # Current queue depth
+        self.max_waiting = [0 for _ in LANES]
+        self.requests = [0 for _ in LANES]
+        self.wait_time = [0.0 for _ in LANES]
+        self.rate_limits = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def acquire(self, lane):
+        """ Wait until a request may be sent in lane.
+
+        Arguments:
+            lane (int): PLAYBACK, QUERY or BACKGROUND
+        """
+        start = time.monotonic()
+        with self._cond:
+            self.waiting[lane] += 1
+            self.max_waiting[lane] = max(self.max_waiting[lane],
+                                         self.waiting[lane])
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    blocked = self.blocked_until - now
+                    if (lane != BACKGROUND and
+                            blocked > MAX_INTERACTIVE_WAIT):
+                        blocked = 0
+                    if blocked > 0:
+                        timeout = blocked
+                    elif any(self.waiting[:lane]):
+                        timeout = None  # Notified when they're done
+                    elif self.tokens >= 1:
+                        self.tokens -= 1
+                        break
+                    else:
+                        timeout = (1 - self.tokens) / self.rate
+                    self._cond.wait(timeout)
+            finally:
+                self.waiting[lane] -= 1
+                self._cond.notify_all()
+            self.requests[lane] += 1
+            self.wait_time[lane] += time.monotonic() - start
+
+    def rate_limited(self, wait):
+        """ Hold back all requests after a 429 response.
+
+        Arguments:
+            wait (float): time in seconds from the Retry-After header
+        """
+        with self._cond:
+            self.blocked_until = max(self.blocked_until,
+                                     time.monotonic() + wait)
+            self.rate_limits += 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """ Scheduler counters as a dict, with the counters for each lane
+        by lane name.
+        """
+        with self._cond:
+            return {
+                'tokens': self.tokens,
+                'rate_limits': self.rate_limits,
+                'blocked_for': max(self.blocked_until - time.monotonic(), 0),
+                'lanes': {
+                    LANE_NAMES[lane]: {
+                        'waiting': self.waiting[lane],
+                        'max_waiting': self.max_waiting[lane],
+                        'requests': self.requests[lane],
+                        'wait_time': self.wait_time[lane]
+                    } for lane in LANES
+                }
+            }
@@ -1,16 +1,64 @@
 import json
 import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from os.path import join, exists
 from shutil import move
+from threading import Event, Lock, Thread
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
+import requests
 from requests import HTTPError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 
 from mycroft.api import DeviceApi
 from mycroft.util.log import LOG
 
 from .auth import AUTH_DIR, SCOPE
+from .metrics import APIMetrics, endpoint
+from .ratelimit import (BACKGROUND, LANE_NAMES, MAX_INTERACTIVE_WAIT,
+                        RequestScheduler, current_lane, default_lane,
+                        request_lane)
+from .tracing import CLIENT, TRACER
+
+# Max total size in bytes of the search results kept in memory, about 10
+# combined searches or 60 single type searches
+SEARCH_CACHE_SIZE = 2 * 1024 * 1024
+# Time in seconds a search result is considered valid
+SEARCH_CACHE_TTL = 15 * 60
+# Time in seconds a search result is kept in the persistent cache
+SEARCH_PERSIST_TTL = 24 * 60 * 60
+# Max number of pages fetched at the same time
+PAGE_FETCH_WORKERS = 4
+# Max number of times a request is sent when rate limited
+RATE_LIMIT_ATTEMPTS = 5
+# Time in seconds to wait when rate limited without a Retry-After header
+DEFAULT_RETRY_AFTER = 1
+# Max number of kept alive connections to the API, enough for the
+# concurrent searches and page fetches
+HTTP_POOL_SIZE = 10
+# Number of retries of failed requests
+HTTP_RETRIES = 3
+# Responses for which the request is retried by the session. 429 isn't
+# retried by the session, it's returned to SpotifyConnect which holds back
+# the requests in the RequestScheduler
+HTTP_RETRY_STATUS = (500, 502, 503, 504)
+# Responses for which the session retries when there's a Retry-After header
+# even if not in HTTP_RETRY_STATUS (urllib3 retries 413, 429 and 503)
+HTTP_RETRY_AFTER_STATUS = frozenset({503})
+# Time in seconds the playback state is reused
+PLAYBACK_SNAPSHOT_TTL = 2
+# Idle time in seconds after which the keep warm request is sent, shorter
+# than the time the API servers keep an idle connection open
+KEEP_WARM_INTERVAL = 45
+# Status of the SpotifyException raised by later spotipy versions when the
+# session ran out of retries, see retries_exhausted()
+RETRIES_EXHAUSTED = 599
+# Base url of the Web API, can be pointed at a local stand-in for testing
+# (see test/benchmarks/api_server.py), None for the Spotify servers
+API_URL = os.environ.get('SPOTIFY_SKILL_API_URL')
 
 
 def get_token(dev_cred):
@@ -67,6 +115,16 @@ def refresh_auth(func):
     return wrapper
 
 
+def invalidates_playback(func):
+    """Playback commands make the playback snapshot outdated."""
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.playback.invalidate()
+    return wrapper
+
+
 def load_local_credentials(user):
     if not exists(AUTH_DIR):
         os.mkdir(AUTH_DIR)
@@ -92,34 +150,472 @@ def load_local_credentials(user):
                         cache_path=token_cache)
 
 
+class SessionRetry(Retry):
+    """ Retry configuration of the API session.
+
+    urllib3 also retries responses with a Retry-After header if their status
+    is in RETRY_AFTER_STATUS_CODES, sleeping in the caller's thread. Only
+    503 is retried that way, a 429 response is returned to the caller.
+    """
+    RETRY_AFTER_STATUS_CODES = HTTP_RETRY_AFTER_STATUS
+
+
+def create_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES):
+    """ Create a requests session for the Spotify API.
+
+    Connections are kept alive in a pool of pool_size connections. Failed
+    connections and the HTTP_RETRY_STATUS responses (500, 502, 503 and 504)
+    are retried with backoff, waiting at least the time in any Retry-After
+    header. Like spotipy's default session read errors aren't retried, the
+    request may have been handled (for example skipping a track).
+
+    429 Too Many Requests is never retried by the session, see
+    SessionRetry, it's left to SpotifyConnect to hold back all requests.
+
+    Arguments:
+        pool_size (int): max number of connections kept alive
+        retries (int): max number of retries of a request
+
+    Returns:
+        (requests.Session) configured session
+    """
+    retry_args = dict(total=retries, connect=retries, read=False,
+                      status=retries, backoff_factor=0.3,
+                      status_forcelist=HTTP_RETRY_STATUS,
+                      respect_retry_after_header=True)
+    # Retry all methods, the argument was renamed in urllib3 1.26
+    try:
+        retry = SessionRetry(allowed_methods=False, **retry_args)
+    except TypeError:
+        retry = SessionRetry(method_whitelist=False, **retry_args)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def retry_after(error):
+    """ Time in seconds to wait before retrying a rate limited request.
+
+    Arguments:
+        error (SpotifyException): exception for the 429 response
+    """
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return max(float(headers.get('Retry-After', DEFAULT_RETRY_AFTER)), 0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+def retries_exhausted(error):
+    """ Check if the session ran out of retries for a request.
+
+    spotipy raises the exception for this as a 429 without the response
+    headers (599 in later versions), a real 429 response has headers.
+
+    Arguments:
+        error (SpotifyException): exception raised by spotipy
+    """
+    return (error.http_status == RETRIES_EXHAUSTED or
+            (error.http_status == 429 and not error.headers))
+
+
+def strip_markets(data):
+    """ Remove the available_markets lists from a Web API response.
+
+    The lists hold up to about 180 country codes for each track and album
+    and are the bulk of a search response. The skill doesn't use them.
+
+    Arguments:
+        data: response structure, modified in place
+
+    Returns:
+        data
+    """
+    if isinstance(data, dict):
+        data.pop('available_markets', None)
+        for value in data.values():
+            strip_markets(value)
+    elif isinstance(data, list):
+        for value in data:
+            strip_markets(value)
+    return data
+
+
+def normalize_query(query):
+    """ Normalize search query for use as cache key.
+
+    Spotify search is case insensitive so the query is lower cased and
+    any extra whitespace is removed.
+    """
+    return ' '.join(query.lower().split())
+
+
+class SearchCache:
+    """ Least recently used cache with expiring entries, bounded by size.
+
+    Arguments:
+        max_size (int): max total size of the entries
+        max_age (float): time in seconds before an entry expires
+    """
+    def __init__(self, max_size=SEARCH_CACHE_SIZE,
+                 max_age=SEARCH_CACHE_TTL):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """ Get cached value.
+
+        Returns:
+            cached value or None if missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored, size, value = entry
+                if time.monotonic() - stored <= self.max_age:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.size -= size
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value, size=1):
+        """ Store value, evicting the least recently used if full.
+
+        Arguments:
+            key: cache key
+            value: value to store
+            size (int): size of the value (for example length in bytes),
+                        a value larger than max_size isn't stored
+        """
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            if size > self.max_size:
+                return
+            self._entries[key] = (time.monotonic(), size, value)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """ Cache counters as a dict. """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class PlaybackSnapshot:
+    """ Short lived copy of the playback state.
+
+    The state is fetched at most once per max_age seconds, concurrent
+    readers wait for the same request. The returned state is shared and
+    must not be modified.
+
+    Arguments:
+        fetch (callable): function fetching the playback state
+        max_age (float): time in seconds the state is reused
+    """
+    def __init__(self, fetch, max_age=PLAYBACK_SNAPSHOT_TTL):
+        self.fetch = fetch
+        self.max_age = max_age
+        self._state = None
+        self._fetched = None
+        self._lock = Lock()
+        self.fetches = 0
+
+    def get(self):
+        """ Get the playback state, fetching it if too old. """
+        with self._lock:
+            if (self._fetched is None or
+                    time.monotonic() - self._fetched > self.max_age):
+                self._state = self.fetch()
+                self._fetched = time.monotonic()
+                self.fetches += 1
+            return self._state
+
+    def invalidate(self):
+        """ Fetch the state again on the next get(). """
+        with self._lock:
+            self._fetched = None
+
+
 class SpotifyConnect(spotipy.Spotify):
     """ Implement the Spotify Connect API.
     See:  https://developer.spotify.com/web-api/
 
     This class extends the spotipy.Spotify class with Spotify Connect
     methods since the Spotipy module including these isn't released yet.
+
+    Search results are cached in memory, see SearchCache, and if a
+    persistent_cache (cache.PersistentCache) is provided also on disk.
+
+    Requests use a session from create_session() unless a requests_session
+    is given. The connection can be kept warm while idle, see
+    start_keep_warm().
+
+    The playback state is shared by status(), is_playing() and
+    current_playback() through a PlaybackSnapshot, so it's only requested
+    once for a user interaction. The playback commands invalidate it.
+
+    All requests go through a RequestScheduler limiting the request rate,
+    see ratelimit.py. When Spotify responds with 429 Too Many Requests all
+    requests are held back for the time in the Retry-After header and the
+    request is sent again. A playback or query request fails instead if
+    the wait is longer than MAX_INTERACTIVE_WAIT. The session doesn't retry
+    429 responses itself, see create_session().
+
+    The requests go to API_URL if set.
+
+    last_request is the time of the last traffic on the connection,
+    including the keep warm requests, last_api_request the time of the
+    last API request.
+
+    The responses are recorded per endpoint in an APIMetrics.
     """
+    def __init__(self, *args, persistent_cache=None, **kwargs):
+        if kwargs.get('requests_session', True) is True:
+            kwargs['requests_session'] = create_session()
+        super().__init__(*args, **kwargs)
+        if API_URL:
+            self.prefix = API_URL.rstrip('/') + '/'
+        self.metrics = APIMetrics()
+        hooks = getattr(self._session, 'hooks', None)
+        if hooks is not None:
+            hooks['response'].append(self.metrics.response_hook)
+        self.search_cache = SearchCache()
+        self.persistent_cache = persistent_cache
+        self.scheduler = RequestScheduler()
+        self.playback = PlaybackSnapshot(super().current_playback)
+        self.last_request = time.monotonic()
+        self.last_api_request = self.last_request
+        self._keep_warm_stop = None
+
+    def _internal_call(self, method, url, payload, params):
+        lane = current_lane()
+        if lane is None:
+            lane = default_lane(method, url)
+        full_url = url if url.startswith('http') else self.prefix + url
+        span_name = endpoint(method, full_url) if TRACER.enabled else ''
+        for attempt in range(RATE_LIMIT_ATTEMPTS):
+            self.scheduler.acquire(lane)
+            start = time.monotonic()
+            self.last_request = start
+            with TRACER.span(span_name, CLIENT, lane=LANE_NAMES[lane],
+                             attempt=attempt) as span:
+                try:
+                    return super()._internal_call(method, url, payload,
+                                                  params)
+                except spotipy.SpotifyException as e:
+                    span.set(status=e.http_status)
+                    if retries_exhausted(e):
+                        self.metrics.record_failure(
+                            method, full_url, time.monotonic() - start)
+                        raise
+                    if (e.http_status != 429 or
+                            attempt == RATE_LIMIT_ATTEMPTS - 1):
+                        raise
+                    wait = retry_after(e)
+                    self.scheduler.rate_limited(wait)
+                    # Don't leave the user waiting for a long rate limit
+                    if lane != BACKGROUND and wait > MAX_INTERACTIVE_WAIT:
+                        raise
+                    LOG.info('Rate limited, retrying in {}s'.format(wait))
+                    self.metrics.record_retry(method, full_url)
+                except requests.RequestException:
+                    self.metrics.record_failure(
+                        method, full_url, time.monotonic() - start)
+                    raise
+                finally:
+                    self.last_request = time.monotonic()
+                    self.last_api_request = self.last_request
+
+    def start_keep_warm(self, interval=KEEP_WARM_INTERVAL):
+        """ Keep a connection to the API open while idle.
+
+        After interval seconds without requests a HEAD request is sent to
+        the API so the next request doesn't have to wait for the DNS lookup
+        and the TCP and TLS handshakes. At most one request per interval is
+        sent and none while the skill is in use.
+
+        Arguments:
+            interval (float): idle time in seconds before a request is sent
+        """
+        if self._keep_warm_stop:
+            return
+        self._keep_warm_stop = Event()
+        Thread(target=self._keep_warm, args=(self._keep_warm_stop, interval),
+               daemon=True, name='SpotifyKeepWarm').start()
+
+    def stop_keep_warm(self):
+        """ Stop keeping the connection open. """
+        if self._keep_warm_stop:
+            self._keep_warm_stop.set()
+            self._keep_warm_stop = None
+
+    def _keep_warm(self, stop, interval):
+        wait = interval
+        while not stop.wait(wait):
+            idle = time.monotonic() - self.last_request
+            if idle >= interval:
+                try:
+                    self._session.head(self.prefix,
+                                       timeout=self.requests_timeout)
+                except requests.RequestException as e:
+                    LOG.debug('Keep warm request failed ({})'.format(repr(e)))
+                self.last_request = time.monotonic()
+                wait = interval
+            else:
+                wait = interval - idle
+
+    def search(self, q, limit=10, offset=0, type='track', market=None):
+        """ Search Spotify, reusing recent results for the same query.
+
+        The results are cached without their available_markets lists, as
+        json text so each caller gets its own copy to modify.
+
+        Arguments are the same as for spotipy.Spotify.search().
+        """
+        key = (normalize_query(q), type, limit, offset, market)
+        with TRACER.span('search', query=key[0], type=type) as span:
+            cache = 'memory'
+            text = self.search_cache.get(key)
+            if text is None and self.persistent_cache:
+                cache = 'disk'
+                result = self.persistent_cache.get('search', json.dumps(key))
+                if result is not None:
+                    text = self._cache_search(key, strip_markets(result))
+            if text is None:
+                cache = None
+                result = strip_markets(
+                    super().search(q, limit, offset, type, market))
+                text = self._cache_search(key, result)
+                if self.persistent_cache and result:
+                    self.persistent_cache.put('search', json.dumps(key),
+                                              result, SEARCH_PERSIST_TTL)
+            span.set(cache_hit=cache is not None, cache=cache)
+            return json.loads(text)
+
+    def _cache_search(self, key, result):
+        """ Store a search result in the memory cache.
+
+        Returns:
+            (str) the result as json text
+        """
+        text = json.dumps(result, separators=(',', ':'))
+        self.search_cache.put(key, text, len(text))
+        return text
+
+    def fetch_page(self, fetch, offset, limit, *args, **kwargs):
+        """ Fetch a single page from a paginated endpoint.
+
+        Arguments:
+            fetch: spotipy method for the endpoint, taking limit and offset
+                   keyword arguments
+            offset (int): index of the first item
+            limit (int): number of items in the page
+            args, kwargs: other arguments for fetch
+
+        Returns:
+            page structure from spotify
+        """
+        return fetch(*args, limit=limit, offset=offset, **kwargs)
+
+    def fetch_all_pages(self, fetch, *args, limit=50,
+                        max_workers=PAGE_FETCH_WORKERS, **kwargs):
+        """ Fetch all items from a paginated endpoint.
+
+        The first page is fetched to find the total number of items, the
+        remaining pages are then fetched concurrently. Works with offset
+        based endpoints like current_user_saved_tracks,
+        current_user_playlists and playlist_items.
+
+        Arguments:
+            fetch: spotipy method for the endpoint, taking limit and offset
+                   keyword arguments
+            args: positional arguments for fetch (for example playlist id)
+            limit (int): number of items per page
+            max_workers (int): max number of pages fetched at the same time
+            kwargs: other keyword arguments for fetch
+
+        Returns:
+            list of all items, in order
+        """
+        first = self.fetch_page(fetch, 0, limit, *args, **kwargs)
+        items = list(first.get('items', []))
+        offsets = range(limit, first.get('total') or 0, limit)
+        if first.get('next') and len(offsets) > 0:
+            lane = current_lane()
+
+            def fetch_offset(offset):
+                with request_lane(lane):
+                    return self.fetch_page(fetch, offset, limit, *args,
+                                           **kwargs)
+
+            workers = min(max_workers, len(offsets))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for page in pool.map(fetch_offset, offsets):
+                    items += page.get('items', [])
+        return items
 
     @refresh_auth
     def get_devices(self):
         """ Get a list of Spotify devices from the API.
 
+        The skill caches the list, see devices.DeviceRegistry.
+
         Returns:
             list of spotify devices connected to the user.
         """
         try:
-            # TODO: Cache for a brief time
             devices = self._get('me/player/devices')['devices']
             return devices
         except Exception as e:
             LOG.error(e)
             return []
 
+    def current_playback(self, market=None, additional_types=None):
+        """ Get the playback state, see PlaybackSnapshot.
+
+        Arguments are the same as for spotipy.Spotify.current_playback(),
+        with arguments the state is always requested.
+        """
+        if market is None and additional_types is None:
+            return self.playback.get()
+        return super().current_playback(market, additional_types)
+
     @refresh_auth
     def status(self):
         """ Get current playback status (across the Spotify system) """
         try:
-            return self._get('me/player/currently-playing')
+            return self.current_playback()
         except Exception as e:
             LOG.error(e)
             return None
@@ -140,12 +636,12 @@ class SpotifyConnect(spotipy.Spotify):
                 return status['is_playing']
 
             # Verify it is playing on the given device
-            dev = self.get_device(device)
-            return dev and dev['is_active']
+            return (status.get('device') or {}).get('id') == device
         except Exception:
             # Technically a 204 return from status() request means 'no track'
             return False  # assume not playing
 
+    @invalidates_playback
     @refresh_auth
     def transfer_playback(self, device_id, force_play=True):
         """ Transfer playback to another device.
@@ -163,6 +659,7 @@ class SpotifyConnect(spotipy.Spotify):
         except Exception as e:
             LOG.error(e)
 
+    @invalidates_playback
     @refresh_auth
     def play(self, device, uris=None, context_uri=None):
         """ Start playback of tracks, albums or artist.
@@ -189,6 +686,7 @@ class SpotifyConnect(spotipy.Spotify):
             LOG.error(e)
             raise
 
+    @invalidates_playback
     @refresh_auth
     def pause(self, device):
         """ Pause user's playback on device.
@@ -202,6 +700,7 @@ class SpotifyConnect(spotipy.Spotify):
         except Exception as e:
             LOG.error(e)
 
+    @invalidates_playback
     @refresh_auth
     def next(self, device):
         """ Skip track.
@@ -215,6 +714,7 @@ class SpotifyConnect(spotipy.Spotify):
         except Exception as e:
             LOG.error(e)
 
+    @invalidates_playback
     @refresh_auth
     def prev(self, device):
         """ Move back in playlist.
@@ -228,6 +728,7 @@ class SpotifyConnect(spotipy.Spotify):
         except Exception as e:
             LOG.error(e)
 
+    @invalidates_playback
     @refresh_auth
     def volume(self, device, volume):
         """ Set volume of device:
@@ -243,6 +744,7 @@ class SpotifyConnect(spotipy.Spotify):
         except Exception as e:
             LOG.error(e)
 
+    @invalidates_playback
     @refresh_auth
     def shuffle(self, state):
         """ Toggle shuffling
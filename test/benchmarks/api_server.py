@@ -0,0 +1,274 @@
+"""Local Spotify Web API stand-in with latency and fault injection.
+
+Serves the endpoints used by the skill from the recorded test data (see
+fixture_api.FixtureAPI) over HTTP, so SpotifyConnect and the skill can be
+load tested without network access. Point the skill at it with the
+SPOTIFY_SKILL_API_URL environment variable:
+
+    python test/benchmarks/api_server.py --port 8099 --latency normal:80:20 \\
+        --rate-limit 20 --error-rate 0.01 --error-burst 3
+    SPOTIFY_SKILL_API_URL=http://localhost:8099/v1/ mycroft-start ...
+
+Faults:
+    --latency         response delay in ms, constant:MS, uniform:LOW:HIGH,
+                      normal:MEAN:STDDEV or exponential:MEAN
+    --rate-limit      max requests per second, further requests get 429
+                      with a Retry-After header
+    --error-rate      probability of a request starting a burst of 5xx
+                      responses, --error-burst responses long
+    --token-lifetime  seconds an access token is accepted after its first
+                      use, then 401 until a new token is used
+
+GET /_stats returns the request counts per endpoint and status as JSON.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import parse_qsl, urlparse
+
+from fixture_api import FixtureAPI
+
+# 5xx statuses returned in an error burst
+ERROR_STATUS = (500, 502, 503)
+
+
+def latency_distribution(spec, rand=random):
+    """ Create a latency function from a distribution spec.
+
+    Arguments:
+        spec (str): distribution and its parameters in ms, for example
+                    'uniform:20:80'
+        rand (Random): random number generator
+
+    Returns:
+        (callable) returning a latency in seconds
+    """
+    name, *args = spec.split(':')
+    args = [float(a) / 1000 for a in args]
+    if name == 'constant':
+        return lambda: args[0]
+    elif name == 'uniform':
+        return lambda: rand.uniform(*args)
+    elif name == 'normal':
+        return lambda: max(rand.gauss(*args), 0)
+    elif name == 'exponential':
+        return lambda: rand.expovariate(1 / args[0])
+    raise ValueError('Unknown latency distribution {}'.format(name))
+
+
+def error(status, message):
+    return {'error': {'status': status, 'message': message}}
+
+
+class Faults:
+    """ Faults injected into the responses.
+
+    Arguments:
+        latency (callable): returns the response delay in seconds
+        rate_limit (float): max requests per second, None for no limit
+        retry_after (int): Retry-After of the 429 responses in seconds,
+                           the end of the current second if None
+        error_rate (float): probability a request starts an error burst
+        error_burst (int): number of 5xx responses in a burst
+        token_lifetime (float): seconds a token is accepted after its
+                                first use, None if tokens don't expire
+        seed (int): seed of the random faults
+    """
+    def __init__(self, latency=None, rate_limit=None, retry_after=None,
+                 error_rate=0, error_burst=1, token_lifetime=None,
+                 seed=None):
+        self.rand = random.Random(seed)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.error_burst = error_burst
+        self.token_lifetime = token_lifetime
+        self.tokens = {}  # Time each token was first used
+        self._second = 0
+        self._requests = 0  # Requests in the current second
+        self._burst = 0  # Remaining error responses
+        self._lock = Lock()
+
+    def delay(self):
+        """ Response delay in seconds. """
+        return self.latency() if self.latency else 0
+
+    def check(self, token):
+        """ Decide whether a request fails.
+
+        Arguments:
+            token (str): the request's access token
+
+        Returns:
+            tuple (status, headers, body) of the failure or None
+        """
+        now = time.time()
+        with self._lock:
+            if self.token_lifetime is not None and token:
+                first_use = self.tokens.setdefault(token, now)
+                if now - first_use > self.token_lifetime:
+                    return 401, {}, error(401, 'The access token expired')
+            if self.rate_limit:
+                second = int(now)
+                if second != self._second:
+                    self._second = second
+                    self._requests = 0
+                self._requests += 1
+                if self._requests > self.rate_limit:
+                    wait = self.retry_after or math.ceil(second + 1 - now)
+                    return (429, {'Retry-After': str(wait)},
+                            error(429, 'API rate limit exceeded'))
+            if not self._burst and self.rand.random() < self.error_rate:
+                self._burst = self.error_burst
+            if self._burst:
+                self._burst -= 1
+                status = self.rand.choice(ERROR_STATUS)
+                return status, {}, error(status, 'Server error')
+        return None
+
+
+class APIServer(ThreadingHTTPServer):
+    """ HTTP server answering from a FixtureAPI with injected faults.
+
+    Arguments:
+        address (tuple): (host, port) to listen on, port 0 for any
+        api (FixtureAPI): API answering the requests
+        faults (Faults): faults to inject, None for none
+    """
+    daemon_threads = True
+
+    def __init__(self, address, api=None, faults=None):
+        super().__init__(address, APIRequestHandler)
+        self.api = api or FixtureAPI()
+        self.faults = faults or Faults()
+        self.requests = Counter()  # Requests per (method, path)
+        self.statuses = Counter()
+        self.bytes_sent = 0
+        self.stats_lock = Lock()
+
+    @property
+    def url(self):
+        """ Base url of the API, the value for SPOTIFY_SKILL_API_URL. """
+        host, port = self.server_address[:2]
+        return 'http://{}:{}/v1/'.format(host, port)
+
+    def start(self):
+        """ Serve in a background thread. """
+        Thread(target=self.serve_forever, daemon=True,
+               name='APIServer').start()
+        return self
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'requests': {'{} {}'.format(*key): count
+                             for key, count in sorted(self.requests.items())},
+                'statuses': {str(status): count for status, count
+                             in sorted(self.statuses.items())},
+                'bytes_sent': self.bytes_sent
+            }
+
+
+class APIRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep the connections alive
+
+    def do_GET(self):
+        self.handle_request()
+
+    do_DELETE = do_POST = do_PUT = do_GET
+
+    def do_HEAD(self):
+        self.respond(404, {}, None)
+
+    def handle_request(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+        if url.path == '/_stats':
+            self.respond(200, {}, self.server.stats())
+            return
+
+        path = url.path.split('/v1/', 1)[-1]
+        with self.server.stats_lock:
+            self.server.requests[(self.command, path)] += 1
+        time.sleep(self.server.faults.delay())
+
+        authorization = self.headers.get('Authorization', '')
+        token = authorization[len('Bearer '):]
+        failure = self.server.faults.check(token)
+        if failure:
+            self.respond(*failure)
+            return
+        try:
+            body = json.loads(data) if data else None
+        except ValueError:
+            self.respond(400, {}, error(400, 'Malformed json'))
+            return
+        status, result = self.server.api.handle(
+            self.command, path, dict(parse_qsl(url.query)), body)
+        self.respond(status, {}, result)
+
+    def respond(self, status, headers, body):
+        content = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if content:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if content and self.command != 'HEAD':
+            self.wfile.write(content)
+        with self.server.stats_lock:
+            self.server.statuses[status] += 1
+            self.server.bytes_sent += len(content)
+
+    def log_message(self, format, *args):
+        pass  # Thousands of requests in a load test
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--device-name', default='Mycroft',
+                        help="name of the skill's device")
+    parser.add_argument('--latency', help='latency distribution in ms')
+    parser.add_argument('--rate-limit', type=float,
+                        help='max requests per second')
+    parser.add_argument('--retry-after', type=int,
+                        help='Retry-After of rate limited requests')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='probability of starting a 5xx burst')
+    parser.add_argument('--error-burst', type=int, default=1,
+                        help='number of 5xx responses in a burst')
+    parser.add_argument('--token-lifetime', type=float,
+                        help='seconds before a token expires')
+    parser.add_argument('--seed', type=int, help='seed of the faults')
+    args = parser.parse_args()
+
+    faults = Faults(None, args.rate_limit, args.retry_after,
+                    args.error_rate, args.error_burst, args.token_lifetime,
+                    args.seed)
+    if args.latency:
+        faults.latency = latency_distribution(args.latency, faults.rand)
+    server = APIServer((args.host, args.port),
+                       FixtureAPI(device_name=args.device_name), faults)
+    print('Serving the Spotify Web API at {}'.format(server.url),
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Spotify Web API stand-in answering with the recorded test data.
+
+FixtureAPI implements the endpoints used by the skill. Searches are
+answered with the test/data file matching the query (for example
+"the beatles" gets beatles.json), other endpoints with a single device and
+an empty library. FixtureSession plugs it into SpotifyConnect in place of
+the requests session.
+"""
+import json
+import re
+import time
+from collections import Counter
+from glob import glob
+from os.path import basename, join, splitext
+from threading import Lock
+from urllib.parse import parse_qsl, urlparse
+
+import requests
+
+from skill_modules import DATA_DIR
+
+DEVICE = {
+    'id': 'b2abb4a01ca748c4cee2c57aad1174141d531710',
+    'is_active': False,
+    'is_private_session': False,
+    'is_restricted': False,
+    'name': 'Mycroft',
+    'type': 'Speaker',
+    'volume_percent': 100
+}
+
+
+def words(text):
+    """ Lower case words of text, without punctuation. """
+    text = re.sub(r'\w+:', ' ', text.lower().replace('_', ' '))
+    return re.sub(r"[^\w ]", '', text).split()
+
+
+def empty_page(limit=20, offset=0):
+    return {'href': '', 'items': [], 'limit': limit, 'next': None,
+            'offset': offset, 'previous': None, 'total': 0}
+
+
+class FixtureAPI:
+    """ Answers Spotify Web API requests with the test data.
+
+    The playback state is kept so the player endpoints behave like a
+    single device account.
+
+    Arguments:
+        data_dir (str): directory with the search result files
+        device_name (str): name of the Spotify Connect device
+    """
+    def __init__(self, data_dir=DATA_DIR, device_name=DEVICE['name']):
+        self.fixtures = {}
+        for path in sorted(glob(join(data_dir, '*.json'))):
+            with open(path) as f:
+                key = tuple(words(splitext(basename(path))[0]))
+                self.fixtures[key] = json.load(f)
+        self.device = dict(DEVICE, name=device_name)
+        self.playback = None
+        self._lock = Lock()
+
+    def search(self, params):
+        query = set(words(params.get('q', '')))
+        limit = int(params.get('limit', 10))
+        matches = [key for key in self.fixtures if set(key) <= query]
+        fixture = self.fixtures[max(matches, key=len)] if matches else {}
+        result = {}
+        for search_type in params.get('type', 'track').split(','):
+            key = search_type + 's'
+            result[key] = fixture.get(key) or empty_page(limit)
+        return result
+
+    def handle(self, method, path, params, body=None):
+        """ Handle a request.
+
+        Arguments:
+            method (str): HTTP method
+            path (str): endpoint path without the /v1/ prefix
+            params (dict): query parameters
+            body (dict): request body
+
+        Returns:
+            tuple (status code, response body or None)
+        """
+        path = path.strip('/')
+        with self._lock:
+            if path == 'search':
+                return 200, self.search(params)
+            elif path == 'me':
+                return 200, {'id': 'user', 'display_name': 'User'}
+            elif path in ('me/tracks', 'me/albums', 'me/playlists',
+                          'me/top/artists', 'me/top/tracks'):
+                return 200, empty_page(int(params.get('limit', 20)),
+                                       int(params.get('offset', 0)))
+            elif path == 'me/player/devices':
+                return 200, {'devices': [self.device]}
+            elif path in ('me/player', 'me/player/currently-playing') and \
+                    method == 'GET':
+                return (200, self.playback) if self.playback else (204, None)
+            elif path == 'me/player' and method == 'PUT':
+                self.device['is_active'] = True
+                self._set_playing((body or {}).get('play', False))
+                return 204, None
+            elif path == 'me/player/play':
+                self.device['is_active'] = True
+                self._set_playing(True)
+                return 204, None
+            elif path == 'me/player/pause':
+                self._set_playing(False)
+                return 204, None
+            elif path in ('me/player/next', 'me/player/previous',
+                          'me/player/volume', 'me/player/shuffle'):
+                return 204, None
+        return 404, {'error': {'status': 404,
+                               'message': 'Service not found'}}
+
+    def _set_playing(self, playing):
+        self.playback = {'device': self.device, 'is_playing': playing,
+                         'progress_ms': 0, 'item': None,
+                         'shuffle_state': False, 'repeat_state': 'off'}
+
+
+def response(method, url, status, body):
+    """ Create a requests response. """
+    result = requests.Response()
+    result.status_code = status
+    result.url = url
+    result.request = requests.Request(method, url).prepare()
+    result.headers['Content-Type'] = 'application/json'
+    result._content = json.dumps(body).encode() if body is not None else b''
+    return result
+
+
+class FixtureSession(requests.Session):
+    """ requests.Session answering from a FixtureAPI instead of the network.
+
+    spotipy only uses a requests_session that is a requests.Session.
+
+    Arguments:
+        api (FixtureAPI): API answering the requests
+        latency (float): time in seconds added to each request
+    """
+    def __init__(self, api, latency=0):
+        super().__init__()
+        self.api = api
+        self.latency = latency
+        self.calls = Counter()  # Requests per (method, path)
+        self._lock = Lock()
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        parsed = urlparse(url)
+        path = parsed.path.split('/v1/', 1)[-1]
+        query = dict(parse_qsl(parsed.query))
+        query.update(params or {})
+        body = json.loads(data) if data else None
+        with self._lock:
+            self.calls[(method, path)] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        status, result = self.api.handle(method, path, query, body)
+        return response(method, url, status, result)
+
+    def head(self, url, **kwargs):
+        return response('HEAD', url, 404, None)
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
@@ -0,0 +1,133 @@
+"""Classification of specific queries in every locale.
+
+Compares matching the locale's patterns one at a time with re.match(), as
+done before query_patterns.QueryPatterns was added, with the combined
+pattern. The phrases are generated from the locale's own patterns (so every
+kind is hit), plus the English play query examples which most locales
+don't match at all, the common case of a generic query. The results of
+both paths are checked to be the same.
+
+    python test/benchmarks/intent_matching.py [phrases per kind]
+"""
+import json
+import random
+import re
+import sys
+import time
+from glob import glob
+from os.path import basename, exists, join
+
+from skill_modules import SKILL_DIR, load_skill_module
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Before Python 3.11
+    import sre_constants
+    import sre_parse
+
+# Text filled in for the titles (.+ in the patterns)
+TITLES = ('queen', 'abbey road', "don't stop believin", 'the wall')
+REPEATS = 5
+
+
+def example(pattern, rand):
+    """ A random phrase matched by a (simple) pattern. """
+    def generate(items):
+        text = ''
+        for op, arg in items:
+            if op == sre_constants.LITERAL:
+                text += chr(arg)
+            elif op == sre_constants.SUBPATTERN:
+                text += generate(arg[-1])
+            elif op == sre_constants.BRANCH:
+                text += generate(rand.choice(arg[1]))
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                low, high, item = arg
+                if list(item) == [(sre_constants.ANY, None)]:
+                    text += rand.choice(TITLES)
+                else:
+                    text += generate(item) * max(low, min(high, 1))
+            elif op == sre_constants.IN:
+                text += generate(arg[:1])
+            elif op == sre_constants.CATEGORY:
+                text += ' ' if arg == sre_constants.CATEGORY_SPACE else 'a'
+            elif op == sre_constants.RANGE:
+                text += chr(arg[0])
+            elif op == sre_constants.ANY:
+                text += 'x'
+        return text
+    return generate(sre_parse.parse(pattern))
+
+
+def locale_patterns(kinds):
+    """ Pattern by kind for each locale, missing files are left out. """
+    locales = {}
+    for path in sorted(glob(join(SKILL_DIR, 'locale', '*'))):
+        patterns = {}
+        for kind in kinds:
+            regex_file = join(path, kind + '.regex')
+            if exists(regex_file):
+                with open(regex_file, encoding='utf-8') as f:
+                    patterns[kind] = f.read().strip()
+        locales[basename(path)] = patterns
+    return locales
+
+
+def english_queries():
+    queries = []
+    for path in sorted(glob(join(SKILL_DIR, 'test', 'intent', '*.json'))):
+        with open(path) as f:
+            example_data = json.load(f)
+        if 'play_query' in example_data:
+            queries.append(example_data['play_query'])
+    return queries
+
+
+def timed(func, phrases):
+    """ Best time per phrase of REPEATS runs and the results. """
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        results = [func(phrase) for phrase in phrases]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(phrases), results
+
+
+def main(per_kind):
+    query_patterns = load_skill_module('query_patterns')
+    kinds = query_patterns.QUERY_KINDS
+    rand = random.Random(0)
+    locales = locale_patterns(kinds)
+    english = english_queries()
+
+    print('{} locales, best of {} runs'.format(len(locales), REPEATS))
+    print('{:<8}{:>7}{:>9}{:>14}{:>12}{:>9}'.format(
+        'locale', 'kinds', 'phrases', 'one at a time', 'combined',
+        'speedup'))
+    for locale, patterns in locales.items():
+        matcher = query_patterns.QueryPatterns(patterns)
+
+        def one_at_a_time(phrase):
+            """ specific_query() before the patterns were combined. """
+            for kind in matcher.kinds:
+                match = re.match(patterns[kind], phrase, re.IGNORECASE)
+                if match:
+                    return kind, match.groupdict()
+            return None, None
+
+        phrases = [example(matcher.patterns[kind], rand)
+                   for kind in matcher.kinds for _ in range(per_kind)]
+        phrases += english
+        old_time, old = timed(one_at_a_time, phrases)
+        new_time, new = timed(matcher.match, phrases)
+        assert old == new, 'Results differ for {}'.format(locale)
+        note = ', '.join('{} invalid'.format(kind)
+                         for kind in matcher.errors)
+        print('{:<8}{:>7}{:>9}{:>11.2f} us{:>9.2f} us{:>8.1f}x  {}'.format(
+            locale, len(matcher.kinds), len(phrases), old_time * 1e6,
+            new_time * 1e6, old_time / new_time, note))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,262 @@
+"""Latency of the play query path, from phrase to playback.
+
+Runs CPS_match_query_phrase() and CPS_start() for the play query examples
+in test/intent with the Spotify Web API answered from test/data (see
+fixture_api.py). Reports the p50/p95/p99 latency of both steps, the number
+of Spotify API requests per phrase and the memory allocated per phrase as
+JSON.
+
+By default the search cache, the device list and the playback state are
+reset before each run so every run takes the full path, with --warm they
+are kept between runs. --latency adds a simulated network delay to each
+API request. The client side rate limit is disabled so the query path is
+measured rather than the throttle, --throttle keeps it.
+
+Requires Mycroft, spotipy and requests to be installed.
+
+    python test/benchmarks/query_latency.py [--runs N] [--warm]
+        [--latency MS] [--throttle] [--output FILE]
+"""
+import argparse
+import json
+import math
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from glob import glob
+from os.path import basename, join, splitext
+
+from fixture_api import FixtureAPI, FixtureSession
+from skill_modules import SKILL_DIR, load_skill, load_skill_module
+
+INTENT_DIR = join(SKILL_DIR, 'test', 'intent')
+PERCENTILES = (50, 95, 99)
+# Request rate and burst of the scheduler when not throttled
+UNTHROTTLED = 10 ** 9
+
+
+def play_queries():
+    """ Play query phrases of the intent examples by example name. """
+    queries = {}
+    for path in sorted(glob(join(INTENT_DIR, '*.json'))):
+        with open(path) as f:
+            example = json.load(f)
+        if 'play_query' in example:
+            queries[splitext(basename(path))[0]] = example['play_query']
+    return queries
+
+
+def percentile(values, p):
+    """ Nearest rank percentile of values. """
+    values = sorted(values)
+    rank = max(math.ceil(p / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def summary(values):
+    """ Percentiles of the latencies in seconds, in milliseconds. """
+    result = {'p{}'.format(p): percentile(values, p) * 1000
+              for p in PERCENTILES}
+    result['max'] = max(values) * 1000
+    return result
+
+
+class BenchmarkBus:
+    """ In process message bus.
+
+    Handlers are called directly when a message is emitted and the end of
+    the speech is reported as soon as something is spoken.
+    """
+    def __init__(self, message_type):
+        self.Message = message_type
+        self.handlers = defaultdict(list)
+        self.emitted = Counter()
+
+    def on(self, msg_type, handler):
+        self.handlers[msg_type].append(handler)
+
+    def once(self, msg_type, handler):
+        def wrapper(message):
+            self.remove(msg_type, wrapper)
+            handler(message)
+        self.on(msg_type, wrapper)
+
+    def remove(self, msg_type, handler):
+        if handler in self.handlers.get(msg_type, []):
+            self.handlers[msg_type].remove(handler)
+
+    def remove_all_listeners(self, msg_type):
+        self.handlers.pop(msg_type, None)
+
+    def emit(self, message):
+        self.emitted[message.msg_type] += 1
+        for handler in list(self.handlers.get(message.msg_type, [])):
+            handler(message)
+        if message.msg_type == 'speak':
+            self.emit(self.Message('recognizer_loop:audio_output_end'))
+
+    def wait_for_response(self, message, reply_type=None, timeout=None):
+        self.emit(message)
+        return None
+
+    def wait_for_message(self, message_type, timeout=None):
+        return None
+
+
+def create_skill(session, throttle=False):
+    """ Set up the skill as initialize() would, without Mycroft running.
+
+    Arguments:
+        session (FixtureSession): session answering the API requests
+        throttle (bool): keep the client side rate limit of the requests
+    """
+    skill_module = load_skill()
+    library = load_skill_module('library')
+    ratelimit = load_skill_module('ratelimit')
+    spotify = load_skill_module('spotify')
+    from mycroft.messagebus import Message
+
+    bus = BenchmarkBus(Message)
+    skill = skill_module.SpotifySkill()
+    skill.bind(bus)
+    skill.add_event('recognizer_loop:audio_output_end',
+                    skill.handle_audio_output_end)
+    skill.device_name = session.api.device['name']
+    skill.saved_tracks = library.SavedTracks()
+    skill.saved_albums = library.SavedAlbums()
+    skill.user_playlists = library.UserPlaylists(
+        on_change=skill.update_library_index)
+    skill.spotify = spotify.SpotifyConnect(auth='token',
+                                           requests_session=session)
+    if not throttle:
+        skill.spotify.scheduler = ratelimit.RequestScheduler(
+            rate=UNTHROTTLED, burst=UNTHROTTLED)
+    skill.user_playlists.refresh(skill.spotify)
+    skill.refresh_saved_tracks()
+    return skill
+
+
+def reset(skill, session):
+    """ Forget the state a run leaves behind. """
+    skill.spotify.search_cache.clear()
+    skill.spotify.playback.invalidate()
+    skill.device_registry.invalidate()
+    session.api.playback = None
+    session.api.device['is_active'] = False
+
+
+def run_phrase(skill, session, phrase):
+    """ Match and start phrase.
+
+    Returns:
+        tuple (match time, start time, match requests, start requests,
+               CPS_match_query_phrase() result)
+    """
+    calls = session.total_calls()
+    start = time.perf_counter()
+    match = skill.CPS_match_query_phrase(phrase)
+    matched = time.perf_counter()
+    match_calls = session.total_calls() - calls
+    if match:
+        skill.CPS_start(match[0], match[2])
+    done = time.perf_counter()
+    start_calls = session.total_calls() - calls - match_calls
+    return matched - start, done - matched, match_calls, start_calls, match
+
+
+def measure(skill, session, phrase, runs, warm):
+    """ Latency, requests and allocations of phrase over runs. """
+    match_times, start_times, requests = [], [], []
+    endpoints = Counter()
+    match = None
+    for _ in range(runs):
+        if not warm:
+            reset(skill, session)
+        before = Counter(session.calls)
+        match_time, start_time, match_calls, start_calls, match = \
+            run_phrase(skill, session, phrase)
+        match_times.append(match_time)
+        start_times.append(start_time)
+        requests.append((match_calls, start_calls))
+        endpoints.update(Counter(session.calls) - before)
+
+    # Allocations, measured separately since tracing slows everything down
+    if not warm:
+        reset(skill, session)
+    tracemalloc.start()
+    run_phrase(skill, session, phrase)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    totals = [m + s for m, s in zip(match_times, start_times)]
+    return {
+        'phrase': phrase,
+        'matched': bool(match),
+        'level': match[1].name if match else None,
+        'type': match[2].get('type') if match else None,
+        'latency_ms': {
+            'match': summary(match_times),
+            'start': summary(start_times),
+            'total': summary(totals)
+        },
+        'api_calls': {
+            'match': sum(m for m, _ in requests) / runs,
+            'start': sum(s for _, s in requests) / runs,
+            'endpoints': {'{} {}'.format(*key): count / runs
+                          for key, count in sorted(endpoints.items())}
+        },
+        'allocations': {'peak_bytes': peak, 'retained_bytes': retained}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=20,
+                        help='runs per phrase')
+    parser.add_argument('--warm', action='store_true',
+                        help='keep the caches between runs')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='simulated latency per API request in ms')
+    parser.add_argument('--throttle', action='store_true',
+                        help='keep the client side rate limit (10 requests '
+                             'per second)')
+    parser.add_argument('--output', help='write the results to this file')
+    args = parser.parse_args()
+
+    session = FixtureSession(FixtureAPI(), args.latency / 1000)
+    skill = create_skill(session, args.throttle)
+    results = {name: measure(skill, session, phrase, args.runs, args.warm)
+               for name, phrase in play_queries().items()}
+    report = {
+        'runs': args.runs,
+        'warm': args.warm,
+        'latency_ms': args.latency,
+        'throttle': args.throttle,
+        'phrases': results,
+        'all': {
+            'total_p95_ms': max(r['latency_ms']['total']['p95']
+                                for r in results.values()),
+            'api_calls': sum(r['api_calls']['match'] +
+                             r['api_calls']['start']
+                             for r in results.values()) / len(results)
+        }
+    }
+    skill.shutdown()
+
+    for name, result in results.items():
+        total = result['latency_ms']['total']
+        print('{:40} {:>8.1f} {:>8.1f} {:>8.1f} ms {:>5.1f} requests'.format(
+            name, total['p50'], total['p95'], total['p99'],
+            result['api_calls']['match'] + result['api_calls']['start']),
+            file=sys.stderr)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
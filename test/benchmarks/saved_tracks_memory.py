@@ -0,0 +1,90 @@
+"""Memory used by the saved tracks library.
+
+Compares the list of track dicts as returned by Spotify, the same list
+with the market lists removed and the column store in library.SavedTracks
+for a synthetic library built from the tracks in test/data.
+
+    python test/benchmarks/saved_tracks_memory.py [number of tracks]
+"""
+import gc
+import json
+import sys
+import tracemalloc
+from glob import glob
+from os.path import join
+
+from skill_modules import DATA_DIR, load_skill_module
+
+
+def fixture_tracks():
+    tracks = []
+    for path in sorted(glob(join(DATA_DIR, '*.json'))):
+        with open(path) as f:
+            data = json.load(f)
+        tracks += data.get('tracks', {}).get('items', [])
+    return tracks
+
+
+def saved_track_items(count):
+    """ Saved track items with unique names and uris, as json text. """
+    tracks = fixture_tracks()
+    items = []
+    for i in range(count):
+        track = dict(tracks[i % len(tracks)])
+        track['id'] = '{:022d}'.format(i)
+        track['uri'] = 'spotify:track:' + track['id']
+        track['name'] = '{} {}'.format(track['name'], i)
+        added_at = '2020-{:02d}-{:02d}T{:02d}:{:02d}:00Z'.format(
+            12 - i // 20000 % 12, 28 - i // 720 % 28, 23 - i // 60 % 24,
+            59 - i % 60)
+        items.append({'added_at': added_at, 'track': track})
+    # Decode the json for every test to get separate objects, as when
+    # received from Spotify
+    return json.dumps(items)
+
+
+def measure(build, text):
+    """ Memory retained by the result of build() in bytes. """
+    gc.collect()
+    tracemalloc.start()
+    result = build(json.loads(text))
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def track_dicts(items):
+    return [item['track'] for item in items]
+
+
+def track_dicts_without_markets(items):
+    tracks = []
+    for item in items:
+        track = item['track']
+        track.pop('available_markets', None)
+        track['album'].pop('available_markets', None)
+        tracks.append(track)
+    return tracks
+
+
+def main(count):
+    library = load_skill_module('library')
+
+    def column_store(items):
+        saved = library.SavedTracks()
+        saved._set_rows([library.track_row(item['added_at'], item['track'])
+                         for item in items])
+        return saved
+
+    text = saved_track_items(count)
+    print('{} saved tracks'.format(count))
+    for name, build in (('list of track dicts', track_dicts),
+                        ('without market lists', track_dicts_without_markets),
+                        ('SavedTracks columns', column_store)):
+        _, size = measure(build, text)
+        print('{:<24}{:>8.1f} MB'.format(name, size / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8000)
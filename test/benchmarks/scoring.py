@@ -0,0 +1,117 @@
+"""Fuzzy scoring of many candidates against a query.
+
+Compares scoring the candidates one at a time, as done before
+matching.Candidates was added, with the batched Candidates methods for the
+track ranking in query_song() and the name lookup in
+get_best_user_playlist() / device_by_name(). The results of both paths are
+checked to be the same.
+
+    python test/benchmarks/scoring.py [number of candidates]
+"""
+import json
+import random
+import sys
+import time
+from glob import glob
+from os.path import join
+
+from skill_modules import DATA_DIR, load_skill_module
+
+# Titles in the test data and a few that aren't
+QUERIES = ('wind of change', 'crazy train', "don't stop believin",
+           'abbey road', 'appetite for destruction', 'dancing queen',
+           'my focus playlist')
+REPEATS = 5
+
+
+def fixture_titles():
+    titles = []
+    for path in sorted(glob(join(DATA_DIR, '*.json'))):
+        with open(path) as f:
+            data = json.load(f)
+        for kind in ('tracks', 'albums', 'artists', 'playlists'):
+            titles += [item['name'] for item in
+                       data.get(kind, {}).get('items', []) if item]
+    return titles
+
+
+def candidate_titles(count):
+    """ The test data titles and random titles made from their words. """
+    titles = fixture_titles()
+    words = sorted({word for title in titles for word in title.split()})
+    suffixes = ('', '', '', ' - Remastered 2011', ' (Live)', ' - Radio Edit')
+    rand = random.Random(0)
+    while len(titles) < count:
+        titles.append(' '.join(rand.sample(words, rand.randint(1, 4))) +
+                      rand.choice(suffixes))
+    rand.shuffle(titles)
+    return titles[:count]
+
+
+def timed(func, *args):
+    """ Best time of REPEATS runs of func and its result. """
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(count):
+    matching = load_skill_module('matching')
+    titles = candidate_titles(count)
+    keys = [title.lower() for title in titles]
+
+    def per_item_similar(query):
+        """ The tracks kept for the popularity sort in query_song(). """
+        scores = [(matching.best_confidence(t, query), i)
+                  for i, t in enumerate(titles)]
+        best = max(scores)[0]
+        return sorted(i for score, i in scores if score > best - 0.1)
+
+    def batched_similar(query):
+        scores = candidates.best_confidences(query, 0.1)
+        best = max(s for s in scores if s is not None)
+        return sorted(i for i, s in enumerate(scores)
+                      if s is not None and s > best - 0.1)
+
+    def per_item_match_one(query):
+        """ mycroft.util.parse.match_one() """
+        best = (None, 0.0)
+        for i, key in enumerate(keys):
+            score = matching.fuzzy_match(query, key)
+            if score > best[1]:
+                best = (i, score)
+        return best
+
+    def batched_match_one(query):
+        return name_candidates.match_one(query)
+
+    start = time.perf_counter()
+    candidates = matching.Candidates(titles, strip=True)
+    prepare_tracks = time.perf_counter() - start
+    start = time.perf_counter()
+    name_candidates = matching.Candidates(titles)
+    prepare_names = time.perf_counter() - start
+
+    print('{} candidates, best of {} runs'.format(count, REPEATS))
+    print('prepare Candidates: {:.1f} ms (strip=True), {:.1f} ms'.format(
+        prepare_tracks * 1000, prepare_names * 1000))
+    print('{:<28}{:>12}{:>12}{:>9}'.format('query', 'per item', 'batched',
+                                           'speedup'))
+    for label, per_item, batched in (
+            ('track ranking', per_item_similar, batched_similar),
+            ('name lookup', per_item_match_one, batched_match_one)):
+        print(label)
+        for query in QUERIES:
+            old_time, old = timed(per_item, query)
+            new_time, new = timed(batched, query)
+            assert old == new, 'Results differ for {}'.format(query)
+            print('  {:<26}{:>9.1f} ms{:>9.1f} ms{:>8.1f}x'.format(
+                query, old_time * 1000, new_time * 1000, old_time / new_time))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,45 @@
+"""Helper for importing the skill modules in the benchmark scripts.
+
+The skill directory is set up as a package without running the skill's
+__init__.py so single modules can be loaded without a running Mycroft
+instance (their own dependencies still need to be installed).
+"""
+import importlib
+import importlib.util
+import sys
+import types
+from os.path import abspath, dirname, join
+
+SKILL_DIR = abspath(join(dirname(__file__), '..', '..'))
+DATA_DIR = join(SKILL_DIR, 'test', 'data')
+PACKAGE = 'spotify_skill'
+
+
+def load_skill_module(name):
+    """ Import a module from the skill.
+
+    Arguments:
+        name (str): module name, for example 'library'
+    """
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [SKILL_DIR]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module('{}.{}'.format(PACKAGE, name))
+
+
+def load_skill():
+    """ Import the skill's __init__.py, requires Mycroft to be installed.
+
+    Returns:
+        the skill module, as module 'skill' of the skill package
+    """
+    load_skill_module('matching')  # Sets up the package
+    name = '{}.skill'.format(PACKAGE)
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            name, join(SKILL_DIR, '__init__.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
@@ -0,0 +1,54 @@
+"""Local HTTP server for the API connection tests."""
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+
+class ScriptedServer(ThreadingHTTPServer):
+    """ Local HTTP server sending scripted responses.
+
+    Arguments:
+        responses (list): (status, headers) of the responses in order, the
+                          last one is repeated
+    """
+    def __init__(self, responses):
+        super().__init__(('127.0.0.1', 0), ScriptedHandler)
+        self.responses = list(responses)
+        self.requests = 0
+        Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/v1/'.format(self.server_address[1])
+
+    def next_response(self):
+        self.requests += 1
+        if len(self.responses) > 1:
+            return self.responses.pop(0)
+        return self.responses[0]
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    def do_GET(self, send_body=True):
+        status, headers = self.server.next_response()
+        body = json.dumps({'status': status}).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET(send_body=False)
+
+    do_PUT = do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
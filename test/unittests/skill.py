@@ -0,0 +1,17 @@
+"""Import the skill modules in the unit tests.
+
+The modules are loaded as in the benchmarks, see
+test/benchmarks/skill_modules.py, Mycroft and the skill's requirements
+need to be installed. The tests aren't part of the test package (its
+__init__.py is the Mycroft skill tester's), run them with
+
+    python -m unittest discover test/unittests
+"""
+import sys
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..', 'benchmarks')))
+
+from skill_modules import load_skill, load_skill_module  # noqa: E402
+
+__all__ = ['load_skill', 'load_skill_module']
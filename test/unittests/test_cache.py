@@ -0,0 +1,97 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from skill import load_skill_module
+
+cache = load_skill_module('cache')
+
+
+class TestPersistentCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = cache.PersistentCache(':memory:', max_size=100)
+        self.addCleanup(self.cache.close)
+
+    def test_put_and_get(self):
+        self.cache.put('search', 'key', {'a': [1, 2]}, 60)
+        self.assertEqual(self.cache.get('search', 'key'), {'a': [1, 2]})
+        self.assertIsNone(self.cache.get('search', 'other'))
+        self.assertIsNone(self.cache.get('library', 'key'))
+
+    def test_expired_entry_is_a_miss(self):
+        self.cache.put('search', 'key', 'value', 60)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertIsNone(self.cache.get('search', 'key'))
+        self.assertEqual(self.cache.size(), 0)
+
+    def test_put_does_not_compact(self):
+        with mock.patch.object(self.cache, 'compact') as compact:
+            for i in range(200):
+                self.cache.put('search', str(i), 'v', 60)
+        compact.assert_not_called()
+
+    def test_get_does_not_write(self):
+        self.cache.put('search', 'key', 'value', 60)
+        changes = self.cache._db.total_changes
+        self.cache.get('search', 'key')
+        self.assertEqual(self.cache._db.total_changes, changes)
+
+    def test_compact_removes_expired_entries(self):
+        self.cache.put('search', 'old', 'value', 60)
+        self.cache.put('search', 'new', 'value', 120)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.cache.compact()
+        self.assertIsNone(self.cache.get('search', 'old'))
+        self.assertEqual(self.cache.get('search', 'new'), 'value')
+
+    def test_compact_evicts_least_recently_used(self):
+        now = time.time()
+        value = 'x' * 28  # 30 bytes as json
+        for i, key in enumerate(('a', 'b', 'c', 'd')):
+            with mock.patch('time.time', return_value=now + i):
+                self.cache.put('search', key, value, 60)
+        self.assertEqual(self.cache.size(), 120)
+        # Reading 'a' makes 'b' the least recently used
+        with mock.patch('time.time', return_value=now + 10):
+            self.cache.get('search', 'a')
+        self.cache.compact()
+        self.assertLessEqual(self.cache.size(), 100)
+        self.assertIsNone(self.cache.get('search', 'b'))
+        for key in ('a', 'c', 'd'):
+            self.assertEqual(self.cache.get('search', key), value)
+
+    def test_no_waiting_for_compaction(self):
+        self.cache.put('search', 'key', 'value', 60)
+        during = {}
+
+        def vacuum():
+            during['unlocked'] = self.cache._lock.acquire(blocking=False)
+            if during['unlocked']:
+                self.cache._lock.release()
+            during['get'] = self.cache.get('search', 'key')
+            self.cache.put('search', 'new', 'value', 60)
+
+        self.cache.max_size = 0  # Trimmed, so the file is rewritten
+        with mock.patch.object(self.cache, '_vacuum', side_effect=vacuum):
+            self.cache.compact()
+        self.assertEqual(during, {'unlocked': True, 'get': None})
+        self.assertEqual(self.cache.size(), 0)  # The put was dropped
+
+    def test_vacuum_shrinks_the_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.db')
+            persistent = cache.PersistentCache(path, max_size=1000)
+            for i in range(200):
+                persistent.put('search', str(i), 'x' * 1000, 60)
+            size = os.path.getsize(path)
+            persistent.compact()
+            self.assertLess(os.path.getsize(path), size / 10)
+            self.assertLessEqual(persistent.size(), 1000)
+            persistent.close()
+
+    def test_failing_database_is_a_miss(self):
+        self.cache.close()
+        self.cache.put('search', 'key', 'value', 60)
+        self.assertIsNone(self.cache.get('search', 'key'))
@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+
+from skill import load_skill_module
+
+devices = load_skill_module('devices')
+
+
+def device(name, active=False):
+    return {'id': name.lower(), 'name': name, 'is_active': active}
+
+
+class TestDeviceRegistry(unittest.TestCase):
+    def setUp(self):
+        self.spotify = mock.Mock()
+        self.spotify.get_devices.return_value = [device('Kitchen'),
+                                                 device('Living Room')]
+        self.registry = devices.DeviceRegistry(max_age=60)
+
+    def test_first_get_waits_for_devices(self):
+        self.assertEqual(len(self.registry.get(self.spotify)), 2)
+        self.assertEqual(len(self.registry.get(self.spotify)), 2)
+        self.spotify.get_devices.assert_called_once_with()
+
+    def test_stale_devices_refresh_in_background(self):
+        self.registry.get(self.spotify)
+        self.registry.fetched -= 61
+        self.spotify.get_devices.return_value = [device('Kitchen')]
+        with mock.patch.object(self.registry, 'refresh_async') as refresh:
+            self.assertEqual(len(self.registry.get(self.spotify)), 2)
+        refresh.assert_called_once_with(self.spotify)
+
+    def test_background_refresh(self):
+        self.registry.get(self.spotify)
+        self.spotify.get_devices.return_value = [device('Kitchen')]
+        self.registry._refresh(self.spotify)
+        self.assertEqual(len(self.registry.get(self.spotify)), 1)
+        self.assertFalse(self.registry._refreshing)
+
+    def test_invalidate_waits_for_new_devices(self):
+        self.registry.get(self.spotify)
+        self.spotify.get_devices.return_value = [device('Kitchen')]
+        self.registry.invalidate()
+        self.assertEqual(len(self.registry.get(self.spotify)), 1)
+
+    def test_no_devices_are_fetched_again(self):
+        self.spotify.get_devices.return_value = []
+        self.registry.get(self.spotify)
+        self.registry.get(self.spotify)
+        self.assertEqual(self.spotify.get_devices.call_count, 2)
+
+    def test_find(self):
+        found = self.registry.find(self.spotify, 'living room')
+        self.assertEqual(found['id'], 'living room')
+        self.assertIsNone(self.registry.find(self.spotify, 'garage xyz'))
+
+    def test_needs_transfer(self):
+        choice = devices.DeviceChoice(device('Kitchen'), None, False)
+        self.assertTrue(choice.needs_transfer)
+        choice = devices.DeviceChoice(device('Kitchen', True), None, False)
+        self.assertFalse(choice.needs_transfer)
+        self.assertFalse(devices.DeviceChoice(None, None, False)
+                         .needs_transfer)
@@ -0,0 +1,203 @@
+import time
+import unittest
+from unittest import mock
+
+from skill import load_skill_module
+
+cache = load_skill_module('cache')
+library = load_skill_module('library')
+
+
+def saved_track(name, added_at):
+    return {'added_at': added_at,
+            'track': {'uri': 'spotify:track:' + name, 'name': name,
+                      'popularity': 50,
+                      'artists': [{'name': 'Artist',
+                                   'uri': 'spotify:artist:a'}],
+                      'album': {'name': 'Album', 'uri': 'spotify:album:a'}}}
+
+
+class SavedTracksAPI:
+    """ Paginated saved tracks endpoint, newest first. """
+    def __init__(self, *items):
+        self.items = list(items)
+        self.pages = []  # Offsets of the fetched pages
+        self.current_user_saved_tracks = object()
+
+    def save(self, item):
+        self.items.insert(0, item)
+
+    def fetch_page(self, fetch, offset, limit):
+        self.pages.append(offset)
+        return {'items': self.items[offset:offset + limit],
+                'next': offset + limit < len(self.items) or None}
+
+    def fetch_all_pages(self, fetch, limit):
+        items = []
+        for offset in range(0, len(self.items), limit):
+            items += self.fetch_page(fetch, offset, limit)['items']
+        return items
+
+
+def added(day):
+    return '2021-01-{:02d}T12:00:00Z'.format(day)
+
+
+class TestSavedTracks(unittest.TestCase):
+    def setUp(self):
+        self.api = SavedTracksAPI(*[saved_track(str(day), added(day))
+                                    for day in range(28, 0, -1)])
+
+    def test_first_sync_fetches_all_tracks(self):
+        tracks = library.SavedTracks()
+        tracks.sync(self.api)
+        self.assertEqual(len(tracks), 28)
+        self.assertEqual(tracks.uris[0], 'spotify:track:28')
+        self.assertEqual(tracks.columns.artists[0], 'Artist')
+        self.assertEqual(tracks.columns.added[0],
+                         library.parse_added_at(added(28)))
+
+    def test_sync_fetches_new_tracks_only(self):
+        tracks = library.SavedTracks()
+        tracks.sync(self.api)
+        version = tracks.version
+        self.api.pages = []
+        self.api.save(saved_track('new', added(29)))
+        tracks.sync(self.api)
+        self.assertEqual(self.api.pages, [0])
+        self.assertEqual(len(tracks), 29)
+        self.assertEqual(tracks.uris[:2], ['spotify:track:new',
+                                           'spotify:track:28'])
+        self.assertEqual(tracks.version, version + 1)
+
+    def test_sync_without_new_tracks(self):
+        tracks = library.SavedTracks()
+        tracks.sync(self.api)
+        version = tracks.version
+        tracks.sync(self.api)
+        self.assertEqual(len(tracks), 28)
+        self.assertEqual(tracks.version, version)
+
+    def test_sync_continues_over_pages(self):
+        tracks = library.SavedTracks()
+        tracks.sync(self.api)
+        self.api.pages = []
+        for i in range(library.PAGE_SIZE + 1):
+            self.api.save(saved_track('new{}'.format(i), added(29)))
+        tracks.sync(self.api)
+        self.assertEqual(self.api.pages, [0, library.PAGE_SIZE])
+        self.assertEqual(len(tracks), 28 + library.PAGE_SIZE + 1)
+
+    def test_saved_again_moves_to_the_top(self):
+        tracks = library.SavedTracks()
+        tracks.sync(self.api)
+        self.api.save(saved_track('5', added(29)))
+        tracks.sync(self.api)
+        self.assertEqual(len(tracks), 28)
+        self.assertEqual(tracks.uris[0], 'spotify:track:5')
+        self.assertEqual(tracks.uris.count('spotify:track:5'), 1)
+
+    def test_same_added_time_as_newest_known(self):
+        tracks = library.SavedTracks()
+        tracks.sync(self.api)
+        self.api.save(saved_track('same', added(28)))
+        tracks.sync(self.api)
+        self.assertEqual(tracks.uris[:2], ['spotify:track:same',
+                                           'spotify:track:28'])
+        self.assertEqual(len(tracks), 29)
+
+    def test_full_sync_finds_removed_tracks(self):
+        tracks = library.SavedTracks()
+        tracks.sync(self.api)
+        del self.api.items[3]
+        tracks.sync(self.api)
+        self.assertEqual(len(tracks), 28)
+        tracks.full_synced -= library.FULL_SYNC_INTERVAL + 1
+        tracks.sync(self.api)
+        self.assertEqual(len(tracks), 27)
+        self.assertAlmostEqual(tracks.full_synced, time.time(), delta=5)
+
+    def test_sync_publishes_columns_at_once(self):
+        tracks = library.SavedTracks()
+        tracks.sync(self.api)
+        columns = tracks.columns
+        self.api.save(saved_track('new', added(29)))
+        tracks.sync(self.api)
+        # Readers holding the previous columns still get consistent rows
+        self.assertEqual(len(columns.uris), 28)
+        self.assertTrue(all(len(column) == 28 for column in columns))
+        self.assertEqual(len(list(tracks.columns.rows())), 29)
+
+    def test_snapshot_is_restored_from_cache(self):
+        persistent = cache.PersistentCache(':memory:')
+        self.addCleanup(persistent.close)
+        tracks = library.SavedTracks(persistent)
+        tracks.sync(self.api)
+        restored = library.SavedTracks(persistent)
+        restored.load()
+        self.assertEqual(list(restored.rows()), list(tracks.rows()))
+        self.assertEqual(restored.synced, tracks.synced)
+        self.api.pages = []
+        restored.sync(self.api)
+        self.assertEqual(self.api.pages, [0])
+
+
+def playlist(name, snapshot='1'):
+    return {'id': name, 'name': name, 'snapshot_id': snapshot,
+            'uri': 'spotify:playlist:' + name}
+
+
+def user_playlists_api(*playlists):
+    spotify = mock.Mock()
+    spotify.fetch_all_pages.return_value = list(playlists)
+    return spotify
+
+
+class TestUserPlaylists(unittest.TestCase):
+    def test_find(self):
+        playlists = library.UserPlaylists()
+        spotify = user_playlists_api(playlist('Morning Jazz'),
+                                     playlist('Workout'))
+        playlists.refresh(spotify)
+        key, data, confidence = playlists.find(spotify, 'morning jazz')
+        self.assertEqual(key, 'morning jazz')
+        self.assertEqual(data['uri'], 'spotify:playlist:Morning Jazz')
+        self.assertEqual(confidence, 1.0)
+
+    def test_find_without_playlists(self):
+        playlists = library.UserPlaylists()
+        playlists.fetched = playlists.max_age = float('inf')
+        self.assertEqual(playlists.find(mock.Mock(), 'jazz'),
+                         (None, None, 0.0))
+
+    def test_refresh_publishes_names_at_once(self):
+        playlists = library.UserPlaylists()
+        playlists.refresh(user_playlists_api(playlist('Jazz')))
+        names = playlists.names
+        playlists.refresh(user_playlists_api(playlist('Rock')))
+        # Readers holding the previous snapshot still get consistent data
+        by_name, candidates = names
+        self.assertEqual(list(by_name), candidates.titles)
+        self.assertEqual(list(playlists.names[0]), ['rock'])
+
+    def test_unchanged_playlists_keep_version(self):
+        changes = mock.Mock()
+        playlists = library.UserPlaylists(on_change=changes)
+        playlists.refresh(user_playlists_api(playlist('Jazz')))
+        version = playlists.version
+        playlists.refresh(user_playlists_api(playlist('Jazz')))
+        self.assertEqual(playlists.version, version)
+        playlists.refresh(user_playlists_api(playlist('Jazz', '2')))
+        self.assertEqual(playlists.version, version + 1)
+        self.assertEqual(changes.call_count, 2)
+
+    def test_stale_playlists_refresh_in_background(self):
+        playlists = library.UserPlaylists(max_age=60)
+        spotify = user_playlists_api(playlist('Jazz'))
+        playlists.refresh(spotify)
+        with mock.patch.object(playlists, 'refresh_async') as refresh:
+            self.assertIn('jazz', playlists.get(spotify))
+            refresh.assert_not_called()
+            playlists.fetched -= 61
+            self.assertIn('jazz', playlists.get(spotify))
+            refresh.assert_called_once_with(spotify)
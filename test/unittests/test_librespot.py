@@ -0,0 +1,63 @@
+import sys
+import time
+import unittest
+from threading import Event
+from unittest import mock
+
+from skill import load_skill_module
+
+librespot = load_skill_module('librespot')
+
+CRASH = [sys.executable, '-c', 'import sys; sys.exit(1)']
+
+
+class TestLibrespotSupervisor(unittest.TestCase):
+    def setUp(self):
+        for name, value in (('MIN_UPTIME', 10), ('RESTART_DELAY', 0.01)):
+            patcher = mock.patch.object(librespot, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.crashed = Event()
+        self.crashes = []
+
+        def on_crash(stats):
+            self.crashes.append(stats)
+            self.crashed.set()
+
+        self.supervisor = librespot.LibrespotSupervisor(
+            self.restart, on_crash=on_crash)
+        self.addCleanup(self.supervisor.stop)
+        self.restart_args = CRASH
+
+    def restart(self):
+        self.supervisor.start(self.restart_args)
+
+    def wait_for_crashes(self, count):
+        for _ in range(500):
+            if len(self.crashes) >= count:
+                return
+            time.sleep(0.01)
+        self.fail('{} of {} crashes'.format(len(self.crashes), count))
+
+    def test_failed_launch_is_not_restarted(self):
+        self.supervisor.start(CRASH)
+        self.wait_for_crashes(1)
+        self.assertFalse(self.crashes[0]['restarting'])
+        time.sleep(0.1)
+        self.assertEqual(self.supervisor.stats()['restarts'], 0)
+
+    @mock.patch.object(librespot, 'MIN_UPTIME', 0.05)
+    def test_crash_loop_is_restarted_with_backoff(self):
+        self.supervisor.start([sys.executable, '-c', 'input()'])
+        time.sleep(0.1)
+        self.supervisor.process.kill()
+        # The restarted processes exit within MIN_UPTIME
+        self.wait_for_crashes(4)
+        self.assertTrue(all(crash['restarting'] for crash in self.crashes))
+        self.assertGreaterEqual(self.supervisor.stats()['restarts'], 3)
+        self.assertGreaterEqual(self.crashes[3]['consecutive_crashes'], 4)
+
+    def test_new_launch_resets_backoff(self):
+        self.supervisor.consecutive_crashes = 5
+        self.supervisor.start([sys.executable, '-c', 'input()'])
+        self.assertEqual(self.supervisor.consecutive_crashes, 0)
@@ -0,0 +1,89 @@
+import time
+import unittest
+from threading import Thread
+
+from skill import load_skill_module
+
+ratelimit = load_skill_module('ratelimit')
+PLAYBACK = ratelimit.PLAYBACK
+QUERY = ratelimit.QUERY
+BACKGROUND = ratelimit.BACKGROUND
+
+
+def timed_acquire(scheduler, lane):
+    start = time.monotonic()
+    scheduler.acquire(lane)
+    return time.monotonic() - start
+
+
+class TestLanes(unittest.TestCase):
+    def test_request_lane(self):
+        self.assertIsNone(ratelimit.current_lane())
+        with ratelimit.request_lane(BACKGROUND):
+            self.assertEqual(ratelimit.current_lane(), BACKGROUND)
+            with ratelimit.request_lane(PLAYBACK):
+                self.assertEqual(ratelimit.current_lane(), PLAYBACK)
+            self.assertEqual(ratelimit.current_lane(), BACKGROUND)
+        self.assertIsNone(ratelimit.current_lane())
+
+    def test_default_lane(self):
+        self.assertEqual(ratelimit.default_lane('PUT', 'me/player/play'),
+                         PLAYBACK)
+        self.assertEqual(ratelimit.default_lane('GET', 'me/player'), QUERY)
+        self.assertEqual(ratelimit.default_lane('GET', 'search'), QUERY)
+
+
+class TestRequestScheduler(unittest.TestCase):
+    def test_burst_then_rate(self):
+        scheduler = ratelimit.RequestScheduler(rate=20, burst=3)
+        for _ in range(3):
+            self.assertLess(timed_acquire(scheduler, QUERY), 0.02)
+        self.assertGreater(timed_acquire(scheduler, QUERY), 0.03)
+        self.assertEqual(scheduler.stats()['lanes']['query']['requests'], 4)
+
+    def test_higher_priority_lane_goes_first(self):
+        scheduler = ratelimit.RequestScheduler(rate=5, burst=1)
+        scheduler.acquire(QUERY)
+        order = []
+
+        def request(lane):
+            scheduler.acquire(lane)
+            order.append(lane)
+
+        background = Thread(target=request, args=(BACKGROUND,))
+        background.start()
+        time.sleep(0.05)
+        playback = Thread(target=request, args=(PLAYBACK,))
+        playback.start()
+        playback.join(2)
+        background.join(2)
+        self.assertEqual(order, [PLAYBACK, BACKGROUND])
+        self.assertEqual(
+            scheduler.stats()['lanes']['background']['max_waiting'], 1)
+
+    def test_rate_limit_holds_back_all_lanes(self):
+        scheduler = ratelimit.RequestScheduler()
+        scheduler.rate_limited(0.2)
+        self.assertGreater(timed_acquire(scheduler, QUERY), 0.15)
+        scheduler.rate_limited(0.2)
+        self.assertGreater(timed_acquire(scheduler, BACKGROUND), 0.15)
+        self.assertEqual(scheduler.stats()['rate_limits'], 2)
+
+    def test_long_rate_limit_only_holds_back_background(self):
+        scheduler = ratelimit.RequestScheduler()
+        scheduler.rate_limited(ratelimit.MAX_INTERACTIVE_WAIT + 5)
+        self.assertLess(timed_acquire(scheduler, PLAYBACK), 0.1)
+        self.assertLess(timed_acquire(scheduler, QUERY), 0.1)
+        blocked = Thread(target=scheduler.acquire, args=(BACKGROUND,),
+                         daemon=True)
+        blocked.start()
+        blocked.join(0.2)
+        self.assertTrue(blocked.is_alive())
+        self.assertEqual(
+            scheduler.stats()['lanes']['background']['waiting'], 1)
+
+    def test_rate_limit_keeps_the_longest_wait(self):
+        scheduler = ratelimit.RequestScheduler()
+        scheduler.rate_limited(30)
+        scheduler.rate_limited(1)
+        self.assertGreater(scheduler.stats()['blocked_for'], 29)
@@ -0,0 +1,125 @@
+import time
+import unittest
+from threading import Event, Timer
+from unittest import mock
+
+from scripted_server import ScriptedServer
+from skill import load_skill
+
+skill = load_skill()
+
+
+def mock_skill(device=None):
+    """ Mock skill instance for calling SpotifySkill methods. """
+    instance = mock.Mock()
+    instance.settings = {}
+    instance.speech_done = Event()
+    instance.resolve_device.return_value = skill.DeviceChoice(
+        device, skill.DeviceType.MYCROFT, False)
+    return instance
+
+
+class TestSpeakThenPlay(unittest.TestCase):
+    def test_no_device_is_not_confirmed(self):
+        instance = mock_skill()
+        with self.assertRaises(skill.NoSpotifyDevicesError):
+            skill.SpotifySkill.speak_then_play(
+                instance, 'ListeningToArtist', {'artist': 'Queen'}, None,
+                context_uri='spotify:artist:queen')
+        instance.speak_dialog.assert_not_called()
+        instance.spotify_play.assert_not_called()
+
+    def test_confirmed_when_device_is_known(self):
+        instance = mock_skill({'id': 'speaker'})
+        instance.speak_dialog.side_effect = \
+            lambda *args: instance.speech_done.set()
+        skill.SpotifySkill.speak_then_play(
+            instance, 'ListeningToArtist', {'artist': 'Queen'}, None,
+            context_uri='spotify:artist:queen')
+        self.assertEqual([c[0] for c in instance.method_calls],
+                         ['resolve_device', 'speak_dialog', 'spotify_play'])
+        instance.spotify_play.assert_called_once_with(
+            'speaker', uris=None, context_uri='spotify:artist:queen')
+
+    def play_after_speech(self, instance, end_of_speech=None):
+        """ Time from speaking to the start of the playback. """
+        played = Event()
+        instance.spotify_play.side_effect = lambda *args, **kwargs: \
+            played.set()
+
+        def speak_dialog(*args):
+            if end_of_speech is not None:
+                # Mycroft emits recognizer_loop:audio_output_end
+                handler = skill.SpotifySkill.handle_audio_output_end
+                Timer(end_of_speech, handler, (instance, mock.Mock())).start()
+
+        instance.speak_dialog.side_effect = speak_dialog
+        start = time.monotonic()
+        skill.SpotifySkill.speak_then_play(instance, 'ListeningToSavedSongs',
+                                           None, None, uris=['track'])
+        self.assertTrue(played.is_set())
+        instance.spotify_play.assert_called_once_with(
+            'speaker', uris=['track'], context_uri=None)
+        return time.monotonic() - start
+
+    def test_play_at_end_of_speech(self):
+        instance = mock_skill({'id': 'speaker'})
+        elapsed = self.play_after_speech(instance, end_of_speech=0.1)
+        self.assertGreaterEqual(elapsed, 0.1)
+        self.assertLess(elapsed, 0.5)
+
+    def test_play_after_speech_timeout(self):
+        instance = mock_skill({'id': 'speaker'})
+        elapsed = self.play_after_speech(instance)
+        self.assertGreaterEqual(elapsed, skill.SPEECH_TIMEOUT)
+        self.assertLess(elapsed, skill.SPEECH_TIMEOUT + 0.5)
+
+    def test_speech_timeout_setting(self):
+        instance = mock_skill({'id': 'speaker'})
+        instance.settings['speech_timeout'] = 0.1
+        self.assertLess(self.play_after_speech(instance), 0.5)
+
+    def test_continue_acknowledges_when_device_is_known(self):
+        instance = mock_skill()
+        with self.assertRaises(skill.NoSpotifyDevicesError):
+            skill.SpotifySkill.continue_current_playlist(instance, None,
+                                                         acknowledge=True)
+        instance.acknowledge.assert_not_called()
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        server = ScriptedServer([(200, {})])
+        self.addCleanup(server.close)
+        self.server = server
+        self.instance = mock_skill()
+        self.instance.spotify = skill.SpotifyConnect(auth='token')
+        self.instance.spotify.prefix = server.url
+        self.instance.prefetcher.budget = 60
+
+    def wait_for_keep_warm(self):
+        spotify = self.instance.spotify
+        spotify.start_keep_warm(0.01)
+        self.addCleanup(spotify.stop_keep_warm)
+        for _ in range(100):
+            if self.server.requests >= 2:
+                break
+            time.sleep(0.01)
+        self.assertGreaterEqual(self.server.requests, 2)
+
+    def test_prefetch_when_idle(self):
+        self.instance.spotify.last_api_request -= skill.PREFETCH_IDLE_TIME
+        skill.SpotifySkill.prefetch(self.instance)
+        self.instance.prefetcher.run.assert_called_once()
+
+    def test_no_prefetch_after_request(self):
+        self.instance.spotify.last_api_request -= skill.PREFETCH_IDLE_TIME
+        self.instance.spotify.me()
+        skill.SpotifySkill.prefetch(self.instance)
+        self.instance.prefetcher.run.assert_not_called()
+
+    def test_prefetch_with_keep_warm(self):
+        self.instance.spotify.last_api_request -= skill.PREFETCH_IDLE_TIME
+        self.wait_for_keep_warm()
+        skill.SpotifySkill.prefetch(self.instance)
+        self.instance.prefetcher.run.assert_called_once()
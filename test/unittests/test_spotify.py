@@ -0,0 +1,244 @@
+import json
+import time
+import unittest
+from threading import Thread
+from unittest import mock
+
+from scripted_server import ScriptedServer
+from skill import load_skill_module
+
+spotify = load_skill_module('spotify')
+
+
+def track(name):
+    return {'name': name, 'uri': 'spotify:track:' + name,
+            'available_markets': ['SE', 'US'],
+            'album': {'name': 'Album', 'available_markets': ['SE']}}
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        self.session = spotify.create_session()
+        self.retry = self.session.get_adapter('https://').max_retries
+
+    def serve(self, *responses):
+        server = ScriptedServer(responses)
+        self.addCleanup(server.close)
+        return server
+
+    def test_retried_statuses(self):
+        for status in (500, 502, 503, 504):
+            self.assertTrue(self.retry.is_retry('GET', status))
+            self.assertTrue(self.retry.is_retry('PUT', status, True))
+
+    def test_rate_limit_is_not_retried(self):
+        self.assertFalse(self.retry.is_retry('GET', 429))
+        self.assertFalse(self.retry.is_retry('GET', 429, True))
+        self.assertFalse(self.retry.is_retry('GET', 413, True))
+
+    def test_rate_limit_reaches_the_caller(self):
+        server = self.serve((429, {'Retry-After': '1'}), (200, {}))
+        start = time.monotonic()
+        response = self.session.get(server.url + 'me')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(server.requests, 1)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_server_error_is_retried(self):
+        server = self.serve((503, {'Retry-After': '0'}), (500, {}),
+                            (200, {}))
+        response = self.session.get(server.url + 'me')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.requests, 3)
+
+
+class TestRateLimit(unittest.TestCase):
+    def connect(self, *responses, retries=spotify.HTTP_RETRIES):
+        server = ScriptedServer(responses)
+        self.addCleanup(server.close)
+        connection = spotify.SpotifyConnect(
+            auth='token',
+            requests_session=spotify.create_session(retries=retries))
+        connection.prefix = server.url
+        return connection, server
+
+    def test_rate_limit_holds_back_requests(self):
+        connection, server = self.connect((429, {'Retry-After': '0'}),
+                                          (200, {}))
+        with mock.patch.object(connection.scheduler, 'rate_limited',
+                               wraps=connection.scheduler.rate_limited) as \
+                rate_limited:
+            self.assertEqual(connection.me(), {'status': 200})
+        rate_limited.assert_called_once_with(0.0)
+        self.assertEqual(server.requests, 2)
+        self.assertEqual(connection.scheduler.stats()['rate_limits'], 1)
+
+    def test_long_rate_limit_fails_interactive_request(self):
+        wait = spotify.MAX_INTERACTIVE_WAIT + 50
+        connection, server = self.connect((429, {'Retry-After': str(wait)}))
+        start = time.monotonic()
+        with self.assertRaises(spotify.spotipy.SpotifyException) as error:
+            connection.me()
+        self.assertEqual(error.exception.http_status, 429)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(server.requests, 1)
+        # Background requests are still held back
+        self.assertGreater(connection.scheduler.stats()['blocked_for'],
+                           spotify.MAX_INTERACTIVE_WAIT)
+
+    def test_exhausted_retries_are_not_a_rate_limit(self):
+        connection, server = self.connect((500, {}), retries=1)
+        with self.assertRaises(spotify.spotipy.SpotifyException) as error:
+            connection.me()
+        self.assertTrue(spotify.retries_exhausted(error.exception))
+        self.assertEqual(server.requests, 2)
+        self.assertEqual(connection.scheduler.stats()['rate_limits'], 0)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_failure_latency_is_measured_from_the_request(self):
+        connection = spotify.SpotifyConnect(auth='token')
+
+        def request(*args, **kwargs):
+            time.sleep(0.05)
+            # A concurrent request or keep warm
+            connection.last_request = time.monotonic()
+            raise spotify.requests.ConnectionError('Connection refused')
+
+        with mock.patch.object(connection._session, 'request',
+                               side_effect=request):
+            with self.assertRaises(spotify.requests.ConnectionError):
+                connection.me()
+        metrics, = connection.metrics.endpoints.values()
+        self.assertEqual(metrics.requests, 1)
+        self.assertGreaterEqual(metrics.latency, 0.05)
+
+    def test_keep_warm_is_not_recorded(self):
+        server = ScriptedServer([(200, {})])
+        self.addCleanup(server.close)
+        connection = spotify.SpotifyConnect(auth='token')
+        connection.prefix = server.url
+        connection.start_keep_warm(0.01)
+        self.addCleanup(connection.stop_keep_warm)
+        for _ in range(100):
+            if server.requests >= 2:
+                break
+            time.sleep(0.01)
+        self.assertGreaterEqual(server.requests, 2)
+        self.assertEqual(connection.metrics.endpoints, {})
+
+
+class TestPlaybackSnapshot(unittest.TestCase):
+    def test_state_is_reused(self):
+        fetch = mock.Mock(return_value={'is_playing': True})
+        snapshot = spotify.PlaybackSnapshot(fetch, max_age=60)
+        self.assertEqual(snapshot.get(), {'is_playing': True})
+        self.assertEqual(snapshot.get(), {'is_playing': True})
+        fetch.assert_called_once_with()
+
+    def test_old_state_is_fetched_again(self):
+        fetch = mock.Mock(return_value=None)
+        snapshot = spotify.PlaybackSnapshot(fetch, max_age=60)
+        snapshot.get()
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            snapshot.get()
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_invalidate(self):
+        fetch = mock.Mock(return_value=None)
+        snapshot = spotify.PlaybackSnapshot(fetch, max_age=60)
+        snapshot.get()
+        snapshot.invalidate()
+        snapshot.get()
+        self.assertEqual(snapshot.fetches, 2)
+
+    def test_concurrent_readers_share_a_fetch(self):
+        def fetch():
+            time.sleep(0.05)
+            return {'is_playing': False}
+
+        snapshot = spotify.PlaybackSnapshot(fetch, max_age=60)
+        threads = [Thread(target=snapshot.get) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(snapshot.fetches, 1)
+
+    def test_playback_commands_invalidate(self):
+        connection = spotify.SpotifyConnect(auth='token')
+        fetch = connection.playback.fetch = mock.Mock(
+            return_value={'is_playing': True})
+        with mock.patch.object(connection, '_put'):
+            self.assertTrue(connection.is_playing())
+            self.assertIsNotNone(connection.status())
+            connection.pause('device')
+            self.assertTrue(connection.is_playing())
+        self.assertEqual(fetch.call_count, 2)
+
+
+class TestSearchCache(unittest.TestCase):
+    def test_evicts_least_recently_used_by_size(self):
+        cache = spotify.SearchCache(max_size=10)
+        cache.put('a', 'A', 4)
+        cache.put('b', 'B', 4)
+        self.assertEqual(cache.get('a'), 'A')
+        cache.put('c', 'C', 4)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertEqual(cache.get('c'), 'C')
+        self.assertEqual(cache.stats()['size'], 8)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_replacing_entry_updates_size(self):
+        cache = spotify.SearchCache(max_size=10)
+        cache.put('a', 'A', 6)
+        cache.put('a', 'AA', 3)
+        self.assertEqual(cache.stats()['size'], 3)
+        self.assertEqual(cache.get('a'), 'AA')
+
+    def test_too_large_value_is_not_stored(self):
+        cache = spotify.SearchCache(max_size=10)
+        cache.put('a', 'A', 4)
+        cache.put('b', 'B', 11)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'A')
+
+    def test_expired_entry_is_removed(self):
+        cache = spotify.SearchCache(max_size=10, max_age=60)
+        cache.put('a', 'A', 4)
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 0)
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.spotify = spotify.SpotifyConnect(auth='token')
+        self.response = {'tracks': {'items': [track('one'), track('two')]}}
+        patcher = mock.patch('spotipy.Spotify.search',
+                             return_value=self.response)
+        self.api_search = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_strip_markets(self):
+        data = spotify.strip_markets({'tracks': {'items': [track('one')]}})
+        item = data['tracks']['items'][0]
+        self.assertNotIn('available_markets', item)
+        self.assertNotIn('available_markets', item['album'])
+
+    def test_result_is_cached_without_markets(self):
+        first = self.spotify.search('One  ', type='track')
+        second = self.spotify.search('one', type='track')
+        self.assertEqual(self.api_search.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertNotIn('available_markets', second['tracks']['items'][0])
+        size = self.spotify.search_cache.stats()['size']
+        self.assertEqual(size, len(json.dumps(second, separators=(',', ':'))))
+
+    def test_callers_get_their_own_copy(self):
+        first = self.spotify.search('one', type='track')
+        first['tracks']['items'] = []
+        second = self.spotify.search('one', type='track')
+        self.assertEqual(len(second['tracks']['items']), 2)
@@ -0,0 +1,241 @@
+"""Tracing of the query and playback pipeline.
+
+Each stage of handling a request is recorded as a span, with the stage
+running when it started as its parent. The spans are written to a rotating
+file as OTLP JSON (the OpenTelemetry protocol's JSON encoding), one
+ExportTraceServiceRequest per line, which the OpenTelemetry collector's
+file receiver and most trace viewers can read.
+
+Tracing is disabled by default, when disabled a span costs a function call
+and an attribute check. Enable it with TRACER.configure().
+
+The parent span is kept per thread, work handed to another thread keeps
+its parent when wrapped with TRACER.propagate().
+"""
+import inspect
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+from threading import Lock, local
+
+SERVICE_NAME = 'mycroft-spotify-skill'
+# Size in bytes at which the trace file is rotated
+MAX_FILE_SIZE = 5 * 1024 * 1024
+# Number of rotated trace files kept
+BACKUP_COUNT = 3
+# OTLP span kinds
+INTERNAL = 1
+CLIENT = 3
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def now_ns():
+    return int(time.time() * 1e9)
+
+
+def otlp_value(value):
+    """ OTLP AnyValue for an attribute value. """
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    elif isinstance(value, int):
+        return {'intValue': str(value)}
+    elif isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class Span:
+    """ A timed stage.
+
+    Arguments:
+        name (str): name of the stage
+        parent (Span): the enclosing span, None for a new trace
+        kind (int): INTERNAL or CLIENT (a request to a service)
+        attributes (dict): attributes describing the stage
+    """
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'kind',
+                 'start', 'end', 'attributes', 'error')
+
+    def __init__(self, name, parent=None, kind=INTERNAL, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else ''
+        self.kind = kind
+        self.start = now_ns()
+        self.end = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def set(self, **attributes):
+        """ Add attributes, None values aren't exported. """
+        self.attributes.update(attributes)
+
+    def as_otlp(self):
+        status = {'code': STATUS_ERROR, 'message': self.error} \
+            if self.error else {'code': STATUS_OK}
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': [{'key': key, 'value': otlp_value(value)}
+                           for key, value in self.attributes.items()
+                           if value is not None],
+            'status': status
+        }
+
+
+class NoSpan:
+    """ Span returned while tracing is disabled. """
+    def set(self, **attributes):
+        pass
+
+
+NO_SPAN = NoSpan()
+
+
+class Tracer:
+    """ Records spans to a rotating file. """
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self._logger = logging.getLogger('spotify_skill.traces')
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._context = local()
+        self._lock = Lock()
+
+    def configure(self, path, max_bytes=MAX_FILE_SIZE,
+                  backup_count=BACKUP_COUNT):
+        """ Enable tracing to the file at path.
+
+        Arguments:
+            path (str): trace file
+            max_bytes (int): size at which the file is rotated
+            backup_count (int): number of rotated files kept
+        """
+        with self._lock:
+            if path == self.path:
+                return
+            self._close()
+            handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                                          backupCount=backup_count)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._logger.addHandler(handler)
+            self.path = path
+            self.enabled = True
+
+    def disable(self):
+        """ Stop tracing and close the trace file. """
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        self.enabled = False
+        self.path = None
+        for handler in list(self._logger.handlers):
+            self._logger.removeHandler(handler)
+            handler.close()
+
+    def current_span(self):
+        """ The innermost span of this thread, NO_SPAN if none. """
+        return getattr(self._context, 'span', None) or NO_SPAN
+
+    @contextmanager
+    def span(self, name, kind=INTERNAL, **attributes):
+        """ Record the enclosed block as a span.
+
+        Arguments:
+            name (str): name of the stage
+            kind (int): INTERNAL or CLIENT
+            attributes: attributes of the span, more can be added with
+                        set() on the yielded span
+        """
+        if not self.enabled:
+            yield NO_SPAN
+            return
+        parent = getattr(self._context, 'span', None)
+        span = Span(name, parent, kind, attributes)
+        self._context.span = span
+        try:
+            yield span
+        except Exception as e:
+            span.error = repr(e)
+            raise
+        finally:
+            self._context.span = parent
+            span.end = now_ns()
+            self._export(span)
+
+    def traced(self, name=None, arguments=(), result=None):
+        """ Decorator recording each call of a function as a span.
+
+        Arguments:
+            name (str): span name, the function name if None
+            arguments (tuple): names of arguments added as attributes
+            result (callable): returns a dict of attributes for the return
+                               value
+        """
+        def decorator(func):
+            span_name = name or func.__name__
+            signature = inspect.signature(func)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                bound = signature.bind(*args, **kwargs).arguments
+                with self.span(span_name, **{a: bound.get(a)
+                                             for a in arguments}) as span:
+                    value = func(*args, **kwargs)
+                    if result:
+                        span.set(**result(value))
+                    return value
+            return wrapper
+        return decorator
+
+    def propagate(self, func):
+        """ Make func run with the calling thread's span as its parent,
+        for work handed to another thread.
+        """
+        parent = getattr(self._context, 'span', None)
+        if not self.enabled or not parent:
+            return func
+
+        @wraps(func)
+        def run(*args, **kwargs):
+            previous = getattr(self._context, 'span', None)
+            self._context.span = parent
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._context.span = previous
+        return run
+
+    def _export(self, span):
+        request = {
+            'resourceSpans': [{
+                'resource': {'attributes': [{
+                    'key': 'service.name',
+                    'value': otlp_value(SERVICE_NAME)
+                }]},
+                'scopeSpans': [{
+                    'scope': {'name': __name__},
+                    'spans': [span.as_otlp()]
+                }]
+            }]
+        }
+        self._logger.info(json.dumps(request, separators=(',', ':')))
+
+
+TRACER = Tracer()